@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+
+# Compare --download-all saving each photo as a file against putting them all
+# into a tar or zip file with --archive, for a lot of small photos. Reports
+# how long each took and how many files and directories it made.
+
+import argparse
+import pathlib
+import subprocess
+import sys
+import tempfile
+import time
+
+here = pathlib.Path(__file__).resolve().parent
+script = here.parent / "yahoo-photos-dl.py"
+server = here / "mock-yg-server.py"
+
+parser = argparse.ArgumentParser(description = "Benchmark --archive")
+parser.add_argument("--photos", type = int, default = 5000)
+parser.add_argument("--size", type = int, default = 8192)
+parser.add_argument("--port", type = int, default = 8865)
+parser.add_argument("--jobs", type = int, default = 16)
+args = parser.parse_args()
+
+runs = [ ("files", []),
+         ("tar", [ "--archive", "tar" ]),
+         ("zip", [ "--archive", "zip" ]),
+         ("tar per album", [ "--archive", "tar", "--archive-per-album" ]) ]
+
+srv = subprocess.Popen([ sys.executable, str(server),
+                         "--port", str(args.port),
+                         "--photos", str(args.photos),
+                         "--size", str(args.size) ],
+                       stdout = subprocess.PIPE, text = True)
+srv.stdout.readline()
+
+try:
+    for name, opts in runs:
+        with tempfile.TemporaryDirectory() as tmp:
+            cmd = [ sys.executable, str(script), "bench", "--no-cookies",
+                    "--api-base", "http://127.0.0.1:" + str(args.port) +
+                    "/api/v3/groups/", "--download-all",
+                    "--jobs", str(args.jobs) ] + opts
+
+            t = time.perf_counter()
+            subprocess.run(cmd, cwd = tmp, check = True,
+                           stdout = subprocess.DEVNULL)
+            elapsed = time.perf_counter() - t
+
+            made = len(list(pathlib.Path(tmp).rglob("*")))
+
+        print("{:<14} {:7.2f}s {:8.1f} photos/s {:7} files made".format(
+                  name, elapsed, args.photos / elapsed, made))
+finally:
+    srv.terminate()
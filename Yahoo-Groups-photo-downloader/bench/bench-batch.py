@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+
+# Compare archiving lots of small groups one process at a time (as a shell
+# loop over the group names would) with doing them all in one process with
+# --batch. The stand-in server answers for any group name.
+
+import argparse
+import pathlib
+import subprocess
+import sys
+import tempfile
+import time
+
+here = pathlib.Path(__file__).resolve().parent
+script = here.parent / "yahoo-photos-dl.py"
+server = here / "mock-yg-server.py"
+
+parser = argparse.ArgumentParser(description = "Benchmark --batch")
+parser.add_argument("--groups", type = int, default = 20)
+parser.add_argument("--photos", type = int, default = 50,
+                    help = "Photos in each group")
+parser.add_argument("--latency", type = float, default = 0.05)
+parser.add_argument("--port", type = int, default = 8835)
+parser.add_argument("--jobs", type = int, default = 16)
+args = parser.parse_args()
+
+groups = [ "group" + str(n) for n in range(args.groups) ]
+base = [ sys.executable, str(script), "--no-cookies", "--api-base",
+         "http://127.0.0.1:" + str(args.port) + "/api/v3/groups/",
+         "--jobs", str(args.jobs) ]
+
+def report(name, elapsed, tmp):
+    saved = len(list(pathlib.Path(tmp).glob("**/*.jpg")))
+    print("{:<12} {:8.2f}s {:6} photos {:8.1f} photos/s".format(
+              name, elapsed, saved, saved / elapsed))
+
+srv = subprocess.Popen([ sys.executable, str(server),
+                         "--port", str(args.port),
+                         "--photos", str(args.photos),
+                         "--latency", str(args.latency) ],
+                       stdout = subprocess.PIPE, text = True)
+srv.stdout.readline()
+
+try:
+    with tempfile.TemporaryDirectory() as tmp:
+        t = time.perf_counter()
+
+        for group in groups:
+            groupdir = pathlib.Path(tmp) / group
+            groupdir.mkdir()
+            subprocess.run(base + [ group, "--download-all" ], cwd = groupdir,
+                           check = True, stdout = subprocess.DEVNULL)
+
+        report("one by one", time.perf_counter() - t, tmp)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        listfile = pathlib.Path(tmp) / "groups.txt"
+        listfile.write_text("\n".join(groups) + "\n")
+
+        t = time.perf_counter()
+        subprocess.run(base + [ "--batch", str(listfile) ], cwd = tmp,
+                       check = True, stdout = subprocess.DEVNULL)
+        report("--batch", time.perf_counter() - t, tmp)
+finally:
+    srv.terminate()
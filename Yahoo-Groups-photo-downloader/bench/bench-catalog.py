@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+
+# Compare the cost of working out each photo's --download-all directory by
+# searching the album list (the old way) with looking it up in a Catalog.
+
+import argparse
+import importlib.util
+import pathlib
+import time
+
+here = pathlib.Path(__file__).resolve().parent
+spec = importlib.util.spec_from_file_location("ypdl",
+                                              here.parent / "yahoo_photos_dl.py")
+ypdl = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(ypdl)
+
+parser = argparse.ArgumentParser(description = "Benchmark album lookups")
+parser.add_argument("--photos", type = int, default = 100000)
+parser.add_argument("--albums", type = int, default = 5000)
+parser.add_argument("--sample", help = "Number of photos to time the old "
+                                       "linear search on (default 2000)",
+                    type = int, default = 2000)
+args = parser.parse_args()
+
+albums = [ ypdl.Album(1000 + n, "Album " + str(n), "x", "", 0, 0, 0)
+           for n in range(args.albums) ]
+photos = [ ypdl.Photo(n, 1000 + n % args.albums, "Photo " + str(n),
+                      "photo" + str(n) + ".jpg", "image/jpeg", "", "x", 0, 0,
+                      1200, 1600, 65536, "http://example.com/img/" + str(n))
+           for n in range(args.photos) ]
+
+# The old way, from main(), when the albums and photos were dicts
+old_albums = [ { "ID": a.ID, "name": a.name } for a in albums ]
+old_photos = [ { "ID": p.ID, "albumID": p.albumID, "name": p.name }
+               for p in photos ]
+
+def old_dirname(photo):
+    a = [ i for i in old_albums if i["ID"] == photo["albumID"] ]
+
+    if a:
+        return str(photo["albumID"]) + " - " + \
+               ypdl.sanitise_filename(a[0]["name"])
+    else:
+        return str(photo["albumID"])
+
+t = time.perf_counter()
+for photo in old_photos[:args.sample]:
+    old_dirname(photo)
+old = (time.perf_counter() - t) / args.sample
+
+t = time.perf_counter()
+catalog = ypdl.Catalog(albums, photos)
+build = time.perf_counter() - t
+
+t = time.perf_counter()
+for photo in photos:
+    catalog.album_dirname(photo.albumID)
+new = (time.perf_counter() - t) / len(photos)
+
+print("{} photos, {} albums".format(args.photos, args.albums))
+print("Linear search: {:10.2f} us/photo, {:8.2f}s for all photos".format(
+          old * 1e6, old * len(photos)))
+print("Catalog:       {:10.2f} us/photo, {:8.2f}s for all photos "
+      "(+{:.2f}s to build)".format(new * 1e6, new * len(photos), build))
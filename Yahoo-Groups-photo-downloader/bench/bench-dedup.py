@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+
+# Compare --download-all with and without --dedup against a stand-in server
+# where some photos have been uploaded to more than one album. Reports how
+# many photos were actually fetched and how much disk the result takes up.
+# The last run downloads into a fresh directory with the store from the run
+# before, as if the group were being archived again.
+
+import argparse
+import pathlib
+import subprocess
+import sys
+import tempfile
+import time
+
+here = pathlib.Path(__file__).resolve().parent
+script = here.parent / "yahoo-photos-dl.py"
+server = here / "mock-yg-server.py"
+
+parser = argparse.ArgumentParser(description = "Benchmark --dedup")
+parser.add_argument("--photos", type = int, default = 1000)
+parser.add_argument("--size", type = int, default = 256 * 1024)
+parser.add_argument("--duplicates", type = int, default = 4,
+                    help = "Make every Nth photo a copy of another")
+parser.add_argument("--port", type = int, default = 8795)
+parser.add_argument("--jobs", type = int, default = 8)
+args = parser.parse_args()
+
+# Space taken up by the files under the given directories, counting each
+# hard-linked file once
+def disk_usage(*dirs):
+    seen = {}
+    for d in dirs:
+        for f in pathlib.Path(d).rglob("*"):
+            if f.is_file():
+                st = f.stat()
+                seen[(st.st_dev, st.st_ino)] = st.st_size
+
+    return sum(seen.values())
+
+def run(cwd, store = None):
+    cmd = [ sys.executable, str(script), "bench", "--no-cookies",
+            "--api-base", "http://127.0.0.1:" + str(args.port) +
+            "/api/v3/groups/", "--download-all", "--jobs", str(args.jobs) ]
+    if store:
+        cmd += [ "--dedup", str(store) ]
+
+    t = time.perf_counter()
+    out = subprocess.run(cmd, cwd = cwd, check = True, text = True,
+                         stdout = subprocess.PIPE).stdout
+    elapsed = time.perf_counter() - t
+
+    return out.count("Downloaded successfully."), elapsed
+
+def report(name, fetched, elapsed, usage):
+    print("{:<16} {:5} fetched {:8.1f} MiB fetched {:8.1f} MiB on disk "
+          "{:6.2f}s".format(name, fetched, fetched * args.size / 2**20,
+                            usage / 2**20, elapsed))
+
+srv = subprocess.Popen([ sys.executable, str(server),
+                         "--port", str(args.port),
+                         "--photos", str(args.photos),
+                         "--size", str(args.size),
+                         "--duplicates", str(args.duplicates) ],
+                       stdout = subprocess.PIPE, text = True)
+srv.stdout.readline()
+
+try:
+    with tempfile.TemporaryDirectory() as tmp:
+        fetched, elapsed = run(tmp)
+        report("plain", fetched, elapsed, disk_usage(tmp))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = pathlib.Path(tmp) / "store"
+        first = pathlib.Path(tmp) / "first"
+        again = pathlib.Path(tmp) / "again"
+        first.mkdir()
+        again.mkdir()
+
+        fetched, elapsed = run(first, store)
+        report("dedup", fetched, elapsed, disk_usage(first, store))
+
+        fetched, elapsed = run(again, store)
+        report("dedup, again", fetched, elapsed,
+               disk_usage(first, again, store))
+finally:
+    srv.terminate()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+
+# Compare the threaded and asyncio download engines on --download-all against
+# a stand-in server with some latency, which is where lots of requests in
+# flight at once pays off. Each run starts with an empty directory.
+
+import argparse
+import pathlib
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+here = pathlib.Path(__file__).resolve().parent
+script = here.parent / "yahoo-photos-dl.py"
+server = here / "mock-yg-server.py"
+
+parser = argparse.ArgumentParser(description = "Benchmark --engine")
+parser.add_argument("--photos", type = int, default = 2000)
+parser.add_argument("--latency", type = float, default = 0.1)
+parser.add_argument("--port", type = int, default = 8785)
+parser.add_argument("--runs", nargs = "+",
+                    default = [ "threads:1", "threads:16", "async:16",
+                                "threads:256", "async:256" ],
+                    help = "ENGINE:JOBS pairs to try", metavar = "ENGINE:JOBS")
+args = parser.parse_args()
+
+srv = subprocess.Popen([ sys.executable, str(server),
+                         "--port", str(args.port),
+                         "--photos", str(args.photos),
+                         "--latency", str(args.latency) ],
+                       stdout = subprocess.PIPE, text = True)
+srv.stdout.readline()
+
+try:
+    for run in args.runs:
+        engine, jobs = run.split(":")
+        before = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            t = time.perf_counter()
+            subprocess.run([ sys.executable, str(script), "bench",
+                             "--no-cookies", "--api-base",
+                             "http://127.0.0.1:" + str(args.port) +
+                             "/api/v3/groups/",
+                             "--download-all", "--engine", engine,
+                             "--jobs", jobs, "--list-jobs", "8" ],
+                           cwd = tmp, check = True,
+                           stdout = subprocess.DEVNULL)
+            elapsed = time.perf_counter() - t
+
+        after = resource.getrusage(resource.RUSAGE_CHILDREN)
+        cpu = (after.ru_utime - before.ru_utime +
+               after.ru_stime - before.ru_stime)
+
+        print("{:<8} jobs={:<4} {:8.2f}s {:8.1f} photos/s {:6.2f}s CPU".format(
+                  engine, jobs, elapsed, args.photos / elapsed, cpu))
+finally:
+    srv.terminate()
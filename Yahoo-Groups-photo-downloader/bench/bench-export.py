@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+
+# Time writing out a big photo listing: the old way (a csv.DictWriter on a dict
+# for each photo with datetimes in it, then a csv.writer on lists with
+# datetimes) against TableWriter in each of its formats. The photos are made
+# up in memory, so this is just the cost of writing the file.
+
+import argparse
+import csv
+import importlib.util
+import pathlib
+import tempfile
+import time
+
+here = pathlib.Path(__file__).resolve().parent
+spec = importlib.util.spec_from_file_location("ypd",
+                                              here.parent / "yahoo_photos_dl.py")
+ypd = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(ypd)
+
+parser = argparse.ArgumentParser(description = "Benchmark listing export")
+parser.add_argument("--rows", type = int, default = 1000000)
+args = parser.parse_args()
+
+photos = [ ypd.Photo(100000 + n, 1000 + n % 97, "Photo " + str(n),
+                     "photo" + str(n) + ".jpg", "image/jpeg",
+                     "Made-up photo number " + str(n), "creator" + str(n % 11),
+                     1262304000 + n * 60, 1262304000 + n * 120, 1200, 1600,
+                     65536 + n, "http://example.com/img/" + str(n))
+           for n in range(args.rows) ]
+
+def dictwriter(filename):
+    with open(filename, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames = ypd.Photo.fields)
+        writer.writeheader()
+
+        for p in photos:
+            writer.writerow({ f: getattr(p, f) for f in ypd.Photo.fields })
+
+def csvwriter(filename):
+    with open(filename, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(ypd.Photo.fields)
+
+        for p in photos:
+            writer.writerow([ getattr(p, f) for f in ypd.Photo.fields ])
+
+def tablewriter(filename):
+    ypd.list_photos_csv(photos, filename)
+
+runs = [ ("DictWriter", dictwriter, "photos.csv"),
+         ("csv.writer", csvwriter, "photos.csv"),
+         ("TableWriter csv", tablewriter, "photos.csv"),
+         ("TableWriter jsonl", tablewriter, "photos.jsonl"),
+         ("TableWriter parquet", tablewriter, "photos.parquet") ]
+
+with tempfile.TemporaryDirectory() as tmp:
+    for name, func, filename in runs:
+        path = pathlib.Path(tmp) / filename
+        t = time.perf_counter()
+        func(path)
+        elapsed = time.perf_counter() - t
+
+        written = max(pathlib.Path(tmp).glob(path.stem + ".*"),
+                      key = lambda f: f.stat().st_mtime)
+        print("{:<20} {:7.2f}s {:10.0f} rows/s {:8.1f} MB".format(
+                  name, elapsed, args.rows / elapsed,
+                  written.stat().st_size / 1e6))
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+
+# Time working out where --download-all saves each of a lot of photos: the
+# old way (building the list of allowed characters and the table of file
+# extensions for every photo, testing each character against the list, and
+# making the album's directory for every photo) against sanitise_filename and
+# DownloadPlan. A third of the names have non-ASCII characters in them. The
+# photos are made up in memory and the directories go in a temporary
+# directory.
+
+import argparse
+import importlib.util
+import pathlib
+import string
+import tempfile
+import time
+
+here = pathlib.Path(__file__).resolve().parent
+spec = importlib.util.spec_from_file_location("ypd",
+                                              here.parent / "yahoo_photos_dl.py")
+ypd = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(ypd)
+
+parser = argparse.ArgumentParser(description = "Benchmark filename planning")
+parser.add_argument("--names", type = int, default = 1000000)
+parser.add_argument("--albums", type = int, default = 100)
+args = parser.parse_args()
+
+def make_name(n):
+    if n % 3 == 0:
+        return "Été à la plage: photo #" + str(n) + "?.jpg"
+    else:
+        return "IMG_" + str(n).zfill(7) + ".JPG"
+
+photos = [ ypd.Photo(100000 + n, 1000 + n % args.albums, "Photo " + str(n),
+                     make_name(n), "image/jpeg", "", "", 0, 0, 1200, 1600,
+                     65536, "http://example.com/img/" + str(n))
+           for n in range(args.names) ]
+albums = [ ypd.Album(1000 + n, "Album " + str(n), "", "", 0, 0, 0)
+           for n in range(args.albums) ]
+
+def old_sanitise_filename(filename):
+    allowed = string.ascii_letters + string.digits + " !()-_=+,.~"
+
+    return ''.join(c if c in allowed else '_' for c in filename)
+
+def old_make_photo_filename(photo):
+    exts = { "image/jpeg":  ".jpg",
+             "image/pjpeg": ".jpg",
+             "image/png":   ".png",
+             "image/gif":   ".gif",
+             "image/bmp":   ".bmp" }
+
+    fileext = exts[photo.filetype] if photo.filetype in exts \
+                else "." + old_sanitise_filename(photo.filetype)
+
+    if photo.filename == "n/a":
+        fn = "ID_" + str(photo.ID) + " - " + \
+             old_sanitise_filename(photo.name) + fileext
+    else:
+        fn = old_sanitise_filename(photo.filename)
+
+    return fn
+
+def old_sanitise():
+    for p in photos:
+        old_sanitise_filename(p.filename)
+
+def new_sanitise():
+    for p in photos:
+        ypd.sanitise_filename(p.filename)
+
+def old_places(root):
+    catalog = ypd.Catalog(albums)
+
+    for p in photos:
+        dirname = catalog.album_dirname(p.albumID)
+        destdir = root / dirname
+        destdir.mkdir(exist_ok = True)
+        destdir / old_make_photo_filename(p)
+
+def new_places(root):
+    plan = ypd.DownloadPlan(root, ypd.Catalog(albums))
+
+    for p in photos:
+        plan.place(p)
+
+runs = [ ("old sanitise", old_sanitise),
+         ("sanitise_filename", new_sanitise),
+         ("old placing", old_places),
+         ("DownloadPlan", new_places) ]
+
+for name, func in runs:
+    with tempfile.TemporaryDirectory() as tmp:
+        t = time.perf_counter()
+
+        if "sanitise" in name:
+            func()
+        else:
+            func(pathlib.Path(tmp))
+
+        elapsed = time.perf_counter() - t
+
+    print("{:<20} {:7.2f}s {:10.0f} names/s".format(
+              name, elapsed, args.names / elapsed))
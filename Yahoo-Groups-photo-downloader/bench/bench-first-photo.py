@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+
+# Measure how long --download-all takes to finish its first download for
+# groups of different sizes. When photos are handled as the listing arrives,
+# this shouldn't depend on how big the group is.
+
+import argparse
+import pathlib
+import subprocess
+import sys
+import tempfile
+import time
+
+here = pathlib.Path(__file__).resolve().parent
+script = here.parent / "yahoo-photos-dl.py"
+server = here / "mock-yg-server.py"
+
+parser = argparse.ArgumentParser(description = "Benchmark time to first "
+                                               "download")
+parser.add_argument("--port", type = int, default = 8772)
+parser.add_argument("--latency", type = float, default = 0.02)
+parser.add_argument("--sizes", help = "Numbers of photos in the group",
+                    type = int, nargs = "+", default = [ 1000, 10000, 50000 ])
+args = parser.parse_args()
+
+for photos in args.sizes:
+    srv = subprocess.Popen([ sys.executable, str(server),
+                             "--port", str(args.port),
+                             "--photos", str(photos),
+                             "--latency", str(args.latency) ],
+                           stdout = subprocess.PIPE, text = True)
+    srv.stdout.readline()
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            t = time.perf_counter()
+            dl = subprocess.Popen([ sys.executable, "-u", str(script), "bench",
+                                    "--no-cookies", "--api-base",
+                                    "http://127.0.0.1:" + str(args.port) +
+                                    "/api/v3/groups/",
+                                    "--download-all" ],
+                                  cwd = tmp, stdout = subprocess.PIPE,
+                                  text = True)
+
+            for line in dl.stdout:
+                if line.startswith("Downloaded successfully"):
+                    break
+
+            elapsed = time.perf_counter() - t
+            dl.kill()
+            dl.wait()
+    finally:
+        srv.terminate()
+        srv.wait()
+
+    print("{:>7} photos: first download after {:6.2f}s".format(photos,
+                                                               elapsed))
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+
+# Compare --download-all against a stand-in server that throws errors, drops
+# connections and throttles, with retries turned off (failing straight away,
+# as the script used to) and on. Reports how many photos were actually saved.
+
+import argparse
+import pathlib
+import subprocess
+import sys
+import tempfile
+import time
+
+here = pathlib.Path(__file__).resolve().parent
+script = here.parent / "yahoo-photos-dl.py"
+server = here / "mock-yg-server.py"
+
+parser = argparse.ArgumentParser(description = "Benchmark retries")
+parser.add_argument("--photos", type = int, default = 500)
+parser.add_argument("--port", type = int, default = 8775)
+parser.add_argument("--error-rate", type = float, default = 0.05)
+parser.add_argument("--drop-rate", type = float, default = 0.05)
+parser.add_argument("--throttle", type = int, default = 200)
+parser.add_argument("--jobs", type = int, default = 8)
+args = parser.parse_args()
+
+srv = subprocess.Popen([ sys.executable, str(server),
+                         "--port", str(args.port),
+                         "--photos", str(args.photos),
+                         "--latency", "0.01",
+                         "--error-rate", str(args.error_rate),
+                         "--drop-rate", str(args.drop_rate),
+                         "--throttle", str(args.throttle) ],
+                       stdout = subprocess.PIPE, text = True)
+srv.stdout.readline()
+
+try:
+    for retries in [ 0, 5 ]:
+        with tempfile.TemporaryDirectory() as tmp:
+            t = time.perf_counter()
+            subprocess.run([ sys.executable, str(script), "bench",
+                             "--no-cookies", "--api-base",
+                             "http://127.0.0.1:" + str(args.port) +
+                             "/api/v3/groups/",
+                             "--download-all", "--jobs", str(args.jobs),
+                             "--retries", str(retries) ],
+                           cwd = tmp, stdout = subprocess.DEVNULL)
+            elapsed = time.perf_counter() - t
+            saved = len([ f for f in pathlib.Path(tmp).glob("*/*.jpg") ])
+
+        print("retries={} {:5} of {} photos saved in {:6.2f}s "
+              "({:6.1f} photos/s)".format(retries, saved, args.photos,
+                                          elapsed, saved / elapsed))
+finally:
+    srv.terminate()
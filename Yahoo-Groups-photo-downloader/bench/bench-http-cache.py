@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+
+# Compare listing every photo in a group without --http-cache, with an empty
+# one and with one from the run before (as a repeat listing of a group that
+# hasn't changed would), going by the bytes the API replies took up according
+# to --trace and how long each run took.
+
+import argparse
+import json
+import pathlib
+import subprocess
+import sys
+import tempfile
+import time
+
+here = pathlib.Path(__file__).resolve().parent
+script = here.parent / "yahoo-photos-dl.py"
+server = here / "mock-yg-server.py"
+
+parser = argparse.ArgumentParser(description = "Benchmark --http-cache")
+parser.add_argument("--photos", type = int, default = 20000)
+parser.add_argument("--text-size", type = int, default = 500)
+parser.add_argument("--latency", type = float, default = 0.02)
+parser.add_argument("--port", type = int, default = 8845)
+args = parser.parse_args()
+
+def run(tmp, cache = None):
+    trace = pathlib.Path(tmp) / "trace.jsonl"
+    cmd = [ sys.executable, str(script), "bench", "--no-cookies",
+            "--api-base", "http://127.0.0.1:" + str(args.port) +
+            "/api/v3/groups/", "--list-photo-ids", "--trace", str(trace) ]
+    if cache:
+        cmd += [ "--http-cache", str(cache) ]
+
+    t = time.perf_counter()
+    subprocess.run(cmd, cwd = tmp, check = True, stdout = subprocess.DEVNULL)
+    elapsed = time.perf_counter() - t
+
+    with open(trace) as f:
+        requests = [ json.loads(line) for line in f ]
+
+    return elapsed, sum(r["bytes"] for r in requests), \
+           sum(r["status"] == 304 for r in requests), len(requests)
+
+def report(name, elapsed, transferred, unchanged, requests):
+    print("{:<16} {:7.2f}s {:10.2f} MB {:5} of {:5} unchanged".format(
+              name, elapsed, transferred / 1e6, unchanged, requests))
+
+srv = subprocess.Popen([ sys.executable, str(server),
+                         "--port", str(args.port),
+                         "--photos", str(args.photos),
+                         "--text-size", str(args.text_size),
+                         "--latency", str(args.latency) ],
+                       stdout = subprocess.PIPE, text = True)
+srv.stdout.readline()
+
+try:
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = pathlib.Path(tmp) / "http.db"
+
+        report("no cache", *run(tmp))
+        report("empty cache", *run(tmp, cache))
+        report("warm cache", *run(tmp, cache))
+finally:
+    srv.terminate()
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+
+# Time --download-all against the stand-in server with different numbers of
+# download threads. Each run starts with an empty directory.
+
+import argparse
+import pathlib
+import subprocess
+import sys
+import tempfile
+import time
+
+here = pathlib.Path(__file__).resolve().parent
+script = here.parent / "yahoo-photos-dl.py"
+server = here / "mock-yg-server.py"
+
+parser = argparse.ArgumentParser(description = "Benchmark --jobs")
+parser.add_argument("--photos", type = int, default = 500)
+parser.add_argument("--latency", type = float, default = 0.02)
+parser.add_argument("--port", type = int, default = 8765)
+parser.add_argument("--jobs", type = int, nargs = "+", default = [ 1, 4, 16 ])
+args = parser.parse_args()
+
+srv = subprocess.Popen([ sys.executable, str(server),
+                         "--port", str(args.port),
+                         "--photos", str(args.photos),
+                         "--latency", str(args.latency) ],
+                       stdout = subprocess.PIPE, text = True)
+srv.stdout.readline()
+
+try:
+    for jobs in args.jobs:
+        with tempfile.TemporaryDirectory() as tmp:
+            t = time.perf_counter()
+            subprocess.run([ sys.executable, str(script), "bench",
+                             "--no-cookies", "--api-base",
+                             "http://127.0.0.1:" + str(args.port) +
+                             "/api/v3/groups/",
+                             "--download-all", "--jobs", str(jobs) ],
+                           cwd = tmp, check = True,
+                           stdout = subprocess.DEVNULL)
+            elapsed = time.perf_counter() - t
+
+        print("jobs={:<4} {:8.2f}s {:8.1f} photos/s".format(
+                  jobs, elapsed, args.photos / elapsed))
+finally:
+    srv.terminate()
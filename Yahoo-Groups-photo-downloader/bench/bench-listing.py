@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+
+# Time listing the whole group (--list-photo-ids) against the stand-in server
+# with different numbers of listing pages fetched at once.
+
+import argparse
+import pathlib
+import subprocess
+import sys
+import time
+
+here = pathlib.Path(__file__).resolve().parent
+script = here.parent / "yahoo-photos-dl.py"
+server = here / "mock-yg-server.py"
+
+parser = argparse.ArgumentParser(description = "Benchmark --list-jobs")
+parser.add_argument("--photos", type = int, default = 20000)
+parser.add_argument("--latency", type = float, default = 0.05)
+parser.add_argument("--port", type = int, default = 8767)
+parser.add_argument("--page-size", type = int, default = 100)
+parser.add_argument("--list-jobs", type = int, nargs = "+",
+                    default = [ 1, 4, 16 ])
+args = parser.parse_args()
+
+srv = subprocess.Popen([ sys.executable, str(server),
+                         "--port", str(args.port),
+                         "--photos", str(args.photos),
+                         "--latency", str(args.latency) ],
+                       stdout = subprocess.PIPE, text = True)
+srv.stdout.readline()
+
+try:
+    for jobs in args.list_jobs:
+        t = time.perf_counter()
+        subprocess.run([ sys.executable, str(script), "bench",
+                         "--no-cookies", "--api-base",
+                         "http://127.0.0.1:" + str(args.port) +
+                         "/api/v3/groups/",
+                         "--list-photo-ids",
+                         "--page-size", str(args.page_size),
+                         "--list-jobs", str(jobs) ],
+                       check = True, stdout = subprocess.DEVNULL)
+        elapsed = time.perf_counter() - t
+
+        print("list-jobs={:<4} {:8.2f}s".format(jobs, elapsed))
+finally:
+    srv.terminate()
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+
+# Measure the peak memory use of downloading a single photo of various sizes
+# from the stand-in server. With streaming downloads this should stay roughly
+# flat however big the photo is.
+
+import argparse
+import pathlib
+import subprocess
+import sys
+import tempfile
+
+here = pathlib.Path(__file__).resolve().parent
+script = here.parent / "yahoo-photos-dl.py"
+server = here / "mock-yg-server.py"
+
+parser = argparse.ArgumentParser(description = "Benchmark download memory use")
+parser.add_argument("--port", type = int, default = 8766)
+parser.add_argument("--sizes", help = "Photo sizes in MiB",
+                    type = int, nargs = "+", default = [ 1, 16, 64, 256 ])
+args = parser.parse_args()
+
+for mib in args.sizes:
+    srv = subprocess.Popen([ sys.executable, str(server),
+                             "--port", str(args.port),
+                             "--photos", "1", "--albums", "1",
+                             "--size", str(mib * 1024 * 1024) ],
+                           stdout = subprocess.PIPE, text = True)
+    srv.stdout.readline()
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            # Run the download from a small wrapper process so that the
+            # peak RSS it reports covers just the one download
+            rss = subprocess.run(
+                [ sys.executable, "-c",
+                  "import resource, subprocess, sys\n"
+                  "subprocess.run(sys.argv[1:], check = True, "
+                  "stdout = subprocess.DEVNULL)\n"
+                  "print(resource.getrusage("
+                  "resource.RUSAGE_CHILDREN).ru_maxrss)",
+                  sys.executable, str(script), "bench", "--no-cookies",
+                  "--api-base",
+                  "http://127.0.0.1:" + str(args.port) + "/api/v3/groups/",
+                  "--download-photo-id", "100000" ],
+                cwd = tmp, check = True, capture_output = True,
+                text = True).stdout
+    finally:
+        srv.terminate()
+        srv.wait()
+
+    print("{:>5} MiB photo: peak RSS {:8.1f} MiB".format(
+              mib, int(rss) / 1024))
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+
+# Compare the memory taken by a big photo list stored as dicts with datetimes
+# (the old layout) against Photo objects.
+
+import argparse
+import importlib.util
+import pathlib
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+here = pathlib.Path(__file__).resolve().parent
+spec = importlib.util.spec_from_file_location("ypdl",
+                                              here.parent / "yahoo_photos_dl.py")
+ypdl = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(ypdl)
+
+parser = argparse.ArgumentParser(description = "Benchmark record memory use")
+parser.add_argument("--photos", type = int, default = 1000000)
+args = parser.parse_args()
+
+# The versions of each photo the API lists: thumbnail, small, high
+# resolution and original, as (name, height, width, size)
+versions = [ ("tn", 75, 100, 4000), ("sn", 180, 240, 15000),
+             ("hr", 768, 1024, 120000), ("or", 1200, 1600, 250000) ]
+
+# A made-up photo as the API would return it
+def api_photo(n):
+    return { "photoId": n, "albumId": 1000 + n % 500,
+             "photoName": "Photo " + str(n),
+             "photoFilename": "photo" + str(n) + ".jpg",
+             "fileType": "image/jpeg", "creatorNickname": "someone",
+             "description": "A photo",
+             "creationDate": 1262304000 + n, "modificationDate": 1262304000 + n,
+             "photoInfo": [ { "height": height, "width": width,
+                              "size": size + n % 1000,
+                              "displayURL": "https://xa.yimg.com/kq/groups/"
+                                            "1234567/" + name + "/" + str(n) +
+                                            "/name/photo" + str(n) + ".jpg" }
+                            for name, height, width, size in versions ] }
+
+# The old layout, from get_photo_list_group(), which only kept the biggest
+# version
+def old_record(photo):
+    photoInfo = max(photo["photoInfo"], key = lambda v: v["height"])
+
+    return { "ID":           photo["photoId"],
+             "albumID":      photo["albumId"],
+             "name":         photo["photoName"],
+             "filename":     photo["photoFilename"],
+             "filetype":     photo["fileType"],
+             "creator":      photo["creatorNickname"],
+             "description":  photo["description"],
+             "created":      datetime.fromtimestamp(photo["creationDate"],
+                                                    timezone.utc),
+             "modified":     datetime.fromtimestamp(photo["modificationDate"],
+                                                    timezone.utc),
+             "height":       photoInfo["height"],
+             "width":        photoInfo["width"],
+             "filesize":     photoInfo["size"],
+             "url":          photoInfo["displayURL"] }
+
+for label, make in [ ("dict", old_record), ("Photo", ypdl.make_photo_record) ]:
+    tracemalloc.start()
+    t = time.perf_counter()
+    photos = [ make(api_photo(n)) for n in range(args.photos) ]
+    elapsed = time.perf_counter() - t
+    size, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print("{:<6} {:8.1f} MiB ({:6.1f} bytes/photo), built in {:.2f}s".format(
+              label, size / 1048576, size / args.photos, elapsed))
+    del photos
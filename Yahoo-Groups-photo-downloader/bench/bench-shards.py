@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+
+# Compare listing every photo in a group in one go (--listing group) against
+# album by album (--listing albums), first against a server that never fails,
+# then against one that fails some requests, with --retries 0 so that every
+# failure counts. Reports how long the listings took, how many of them got
+# every photo and how many requests went to the server according to --trace.
+
+import argparse
+import pathlib
+import subprocess
+import sys
+import tempfile
+import time
+
+here = pathlib.Path(__file__).resolve().parent
+script = here.parent / "yahoo-photos-dl.py"
+server = here / "mock-yg-server.py"
+
+parser = argparse.ArgumentParser(description = "Benchmark --listing albums")
+parser.add_argument("--photos", type = int, default = 20000)
+parser.add_argument("--albums", type = int, default = 50)
+parser.add_argument("--latency", type = float, default = 0.02)
+parser.add_argument("--error-rate", type = float, default = 0.02)
+parser.add_argument("--runs", type = int, default = 5)
+parser.add_argument("--port", type = int, default = 8885)
+args = parser.parse_args()
+
+def start_server(error_rate):
+    srv = subprocess.Popen([ sys.executable, str(server),
+                             "--port", str(args.port),
+                             "--photos", str(args.photos),
+                             "--albums", str(args.albums),
+                             "--latency", str(args.latency),
+                             "--error-rate", str(error_rate) ],
+                           stdout = subprocess.PIPE, text = True)
+    srv.stdout.readline()
+    return srv
+
+# List the photos, returning how long it took, whether every photo was
+# listed and how many requests were made
+def run(tmp, listing):
+    trace = pathlib.Path(tmp) / "trace.jsonl"
+    cmd = [ sys.executable, str(script), "bench", "--no-cookies",
+            "--api-base", "http://127.0.0.1:" + str(args.port) +
+            "/api/v3/groups/", "--list-photo-ids", "--retries", "0",
+            "--listing", listing, "--trace", str(trace) ]
+
+    t = time.perf_counter()
+    done = subprocess.run(cmd, cwd = tmp, stdout = subprocess.DEVNULL)
+    elapsed = time.perf_counter() - t
+
+    with open(trace) as f:
+        requests = sum(1 for line in f)
+
+    return elapsed, done.returncode == 0, requests
+
+for error_rate in (0, args.error_rate):
+    srv = start_server(error_rate)
+
+    try:
+        for listing in ("group", "albums"):
+            with tempfile.TemporaryDirectory() as tmp:
+                results = [ run(tmp, listing) for _ in range(args.runs) ]
+
+            print("{:<8} {:4.0%} errors {:7.2f}s {:3} of {:3} complete "
+                  "{:7.0f} requests".format(
+                      listing, error_rate,
+                      sum(r[0] for r in results) / args.runs,
+                      sum(r[1] for r in results), args.runs,
+                      sum(r[2] for r in results) / args.runs))
+    finally:
+        srv.terminate()
+        srv.wait()
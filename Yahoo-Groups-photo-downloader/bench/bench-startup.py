@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+
+# Time how long short runs of the script take from start to finish, which is
+# mostly startup: --help, listing the albums from a warm --cache, listing the
+# albums from the stand-in server and downloading a single photo from it.
+# Each is the best of several runs. Use --script to time another version of
+# the script (e.g. one saved from git) for comparison.
+
+import argparse
+import pathlib
+import subprocess
+import sys
+import tempfile
+import time
+
+here = pathlib.Path(__file__).resolve().parent
+server = here / "mock-yg-server.py"
+
+parser = argparse.ArgumentParser(description = "Benchmark startup time")
+parser.add_argument("--script", default = str(here.parent / "yahoo-photos-dl.py"))
+parser.add_argument("--runs", type = int, default = 10)
+parser.add_argument("--port", type = int, default = 8825)
+args = parser.parse_args()
+
+api = [ "--no-cookies", "--api-base",
+        "http://127.0.0.1:" + str(args.port) + "/api/v3/groups/" ]
+
+modes = [ ("help",           [ "--help" ]),
+          ("cached listing", [ "bench" ] + api + [ "--cache", "cache.db",
+                                                   "--list-albums" ]),
+          ("listing",        [ "bench" ] + api + [ "--list-albums" ]),
+          ("download",       [ "bench" ] + api + [ "--download-photo-id",
+                                                   "100000" ]) ]
+
+# The quickest of several runs, in milliseconds
+def best(cmd, cwd):
+    times = []
+
+    for _ in range(args.runs):
+        t = time.perf_counter()
+        subprocess.run(cmd, cwd = cwd, check = True,
+                       stdout = subprocess.DEVNULL)
+        times.append(time.perf_counter() - t)
+
+    return min(times) * 1000
+
+srv = subprocess.Popen([ sys.executable, str(server),
+                         "--port", str(args.port), "--photos", "100" ],
+                       stdout = subprocess.PIPE, text = True)
+srv.stdout.readline()
+
+try:
+    with tempfile.TemporaryDirectory() as tmp:
+        print("{:<16} {:8.1f} ms".format(
+                  "python itself", best([ sys.executable, "-c", "pass" ], tmp)))
+
+        # Fill the cache for the cached listing
+        subprocess.run([ sys.executable, args.script ] + modes[1][1],
+                       cwd = tmp, check = True, stdout = subprocess.DEVNULL)
+
+        for name, opts in modes:
+            print("{:<16} {:8.1f} ms".format(
+                      name, best([ sys.executable, args.script ] + opts, tmp)))
+finally:
+    srv.terminate()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+
+# Time --verify. First a group is downloaded with and without it, to see what
+# checking the photos as they arrive costs. Then the photos already there are
+# checked again: one after another in this process with check_image, and
+# with --download-all --verify (where every photo is already there, so all it
+# does is check them) with different numbers of --verify-jobs. How long
+# --download-all takes to find they're all there without --verify is given
+# for comparison.
+
+import argparse
+import importlib.util
+import os
+import pathlib
+import subprocess
+import sys
+import tempfile
+import time
+
+here = pathlib.Path(__file__).resolve().parent
+script = here.parent / "yahoo-photos-dl.py"
+server = here / "mock-yg-server.py"
+
+spec = importlib.util.spec_from_file_location("ypd", here.parent /
+                                              "yahoo_photos_dl.py")
+ypd = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(ypd)
+
+parser = argparse.ArgumentParser(description = "Benchmark --verify")
+parser.add_argument("--photos", type = int, default = 5000)
+parser.add_argument("--size", type = int, default = 262144)
+parser.add_argument("--port", type = int, default = 8875)
+parser.add_argument("--jobs", type = int, default = 16)
+args = parser.parse_args()
+
+cpus = os.cpu_count()
+
+def run(tmp, opts):
+    cmd = [ sys.executable, str(script), "bench", "--no-cookies",
+            "--api-base", "http://127.0.0.1:" + str(args.port) +
+            "/api/v3/groups/", "--download-all",
+            "--jobs", str(args.jobs) ] + opts
+
+    t = time.perf_counter()
+    subprocess.run(cmd, cwd = tmp, check = True, stdout = subprocess.DEVNULL)
+    return time.perf_counter() - t
+
+def one_by_one(tmp):
+    t = time.perf_counter()
+
+    for filename in pathlib.Path(tmp).glob("*/*.jpg"):
+        ypd.check_image(str(filename), "image/jpeg", 1200, 1600)
+
+    return time.perf_counter() - t
+
+def report(name, elapsed):
+    print("{:<26} {:7.2f}s {:8.1f} photos/s".format(
+              name, elapsed, args.photos / elapsed))
+
+srv = subprocess.Popen([ sys.executable, str(server),
+                         "--port", str(args.port),
+                         "--photos", str(args.photos),
+                         "--size", str(args.size) ],
+                       stdout = subprocess.PIPE, text = True)
+srv.stdout.readline()
+
+try:
+    with tempfile.TemporaryDirectory() as tmp:
+        report("download", run(tmp, []))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        report("download with --verify", run(tmp, [ "--verify" ]))
+
+        report("already there", run(tmp, []))
+        report("check one by one", one_by_one(tmp))
+
+        for jobs in sorted({ 1, 2, cpus }):
+            report("--verify-jobs " + str(jobs),
+                   run(tmp, [ "--verify", "--verify-jobs", str(jobs) ]))
+finally:
+    srv.terminate()
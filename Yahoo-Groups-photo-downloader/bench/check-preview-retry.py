@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+
+# Check that --retry-failed replaces the previews left by a --preview run
+# that was killed while it was fetching the full versions: every photo should
+# end up the full size. Exits with 1 (and says which photos) if not.
+
+import argparse
+import pathlib
+import subprocess
+import sys
+import tempfile
+
+here = pathlib.Path(__file__).resolve().parent
+script = here.parent / "yahoo-photos-dl.py"
+server = here / "mock-yg-server.py"
+
+parser = argparse.ArgumentParser(description = "Check --retry-failed after "
+                                               "an interrupted --preview")
+parser.add_argument("--photos", type = int, default = 40)
+parser.add_argument("--size", type = int, default = 20000)
+parser.add_argument("--port", type = int, default = 8879)
+args = parser.parse_args()
+
+srv = subprocess.Popen([ sys.executable, str(server),
+                         "--port", str(args.port),
+                         "--photos", str(args.photos),
+                         "--size", str(args.size),
+                         "--latency", "0.05" ],
+                       stdout = subprocess.PIPE, text = True)
+srv.stdout.readline()
+
+def command(*opts):
+    return [ sys.executable, str(script), "check", "--no-cookies",
+             "--api-base", "http://127.0.0.1:" + str(args.port) +
+             "/api/v3/groups/", "--journal", "journal.db", "--jobs", "1" ] + \
+           list(opts)
+
+try:
+    with tempfile.TemporaryDirectory() as tmp:
+        # Kill it a few photos into replacing the previews
+        run = subprocess.Popen(command("--download-all", "--preview"),
+                               cwd = tmp, stdout = subprocess.PIPE,
+                               text = True)
+        replaced = None
+
+        for line in run.stdout:
+            if line.startswith("Replacing "):
+                replaced = 0
+            elif replaced is not None and line.startswith("Downloaded"):
+                replaced += 1
+
+                if replaced == 3:
+                    break
+
+        run.kill()
+        run.wait()
+
+        if replaced is None:
+            sys.exit("The --preview run finished before it could be killed")
+
+        subprocess.run(command("--retry-failed"), cwd = tmp, check = True,
+                       stdout = subprocess.DEVNULL)
+
+        small = sorted(f.name for f in pathlib.Path(tmp).glob("*/*.jpg")
+                       if f.stat().st_size != args.size)
+        files = len(list(pathlib.Path(tmp).glob("*/*.jpg")))
+finally:
+    srv.terminate()
+
+if small or files != args.photos:
+    print(str(files) + " photos, still previews: " + " ".join(small))
+    sys.exit(1)
+
+print("All " + str(files) + " previews replaced")
@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+
+# A stand-in for the Yahoo! Groups photo API so that yahoo-photos-dl.py can be
+# exercised without a Yahoo login. It invents a group full of albums and
+# photos and serves made-up image data for them.
+#
+# Point the downloader at it with:
+#   yahoo-photos-dl.py --no-cookies --api-base http://127.0.0.1:8000/api/v3/groups/ ...
+
+import argparse
+import collections
+import email.utils
+import hashlib
+import json
+import random
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Settings for the fake group - filled in from the command line
+opts = None
+
+# When the server started, which is given as the Last-Modified time of every
+# API reply since nothing changes while it's running
+started = email.utils.formatdate(usegmt = True)
+
+# Times of requests in the last second, for --throttle
+recent = collections.deque()
+recent_lock = threading.Lock()
+
+# Should this request be turned away for going over the --throttle rate?
+def over_rate():
+    if not opts.throttle:
+        return False
+
+    with recent_lock:
+        now = time.monotonic()
+        while recent and recent[0] < now - 1:
+            recent.popleft()
+
+        if len(recent) >= opts.throttle:
+            return True
+
+        recent.append(now)
+        return False
+
+# The size of a full-size photo. With --size-spread these vary around --size,
+# but always come out the same for the same photo
+def photo_size(n):
+    if not opts.size_spread:
+        return opts.size
+
+    r = random.Random(n).uniform(-opts.size_spread, opts.size_spread)
+    return max(16, int(opts.size * (1 + r)))
+
+# A description padded out to --text-size characters, to make the listings
+# bigger
+def description(text):
+    return text.ljust(opts.text_size, ".")
+
+def make_album(n):
+    return { "albumId":          1000 + n,
+             "albumName":        "Album " + str(n),
+             "creatorNickname":  "creator" + str(n % 7),
+             "description":      description("Made-up album number " +
+                                             str(n)),
+             "creationDate":     1262304000 + n * 3600,
+             "modificationDate": 1262304000 + n * 7200,
+             "total":            album_size(n) }
+
+# Photos are dealt out round-robin across the albums
+def album_size(n):
+    return opts.photos // opts.albums + (1 if n < opts.photos % opts.albums
+                                         else 0)
+
+# With --duplicates, every Nth photo is a re-upload of an earlier one into a
+# different album: the same filename, size and image data. Returns the
+# number of the photo whose image this one has
+def original(n):
+    if opts.duplicates and n % opts.duplicates == opts.duplicates - 1:
+        m = n // 2
+        if m % opts.albums != n % opts.albums:
+            return m
+
+    return n
+
+# With --edited, every Nth photo looks as though it was edited a year after
+# it was uploaded. Only the modification date changes, so a mirror can only
+# tell by looking at that
+def modified(n):
+    date = 1262304000 + n * 120
+
+    if opts.edited and n % opts.edited == 0:
+        date += 365 * 86400
+
+    return date
+
+def make_photo(n):
+    m = original(n)
+    size = photo_size(m)
+    base = "http://" + opts.host + ":" + str(opts.port) + "/img/" + str(m)
+
+    return { "photoId":          100000 + n,
+             "albumId":          1000 + n % opts.albums,
+             "photoName":        "Photo " + str(n),
+             "photoFilename":    "photo" + str(m) + ".jpg",
+             "fileType":         "image/jpeg",
+             "creatorNickname":  "creator" + str(n % 11),
+             "description":      description("Made-up photo number " +
+                                             str(n)),
+             "creationDate":     1262304000 + n * 60,
+             "modificationDate": modified(n),
+             "photoInfo": [
+                 { "height": 120, "width": 160, "size": size // 16,
+                   "displayURL": base + "/tn" },
+                 { "height": 1200, "width": 1600, "size": size,
+                   "displayURL": base + "/or" } ] }
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        if opts.verbose:
+            super().log_message(format, *args)
+
+    def send_body(self, body, ctype, status = 200):
+        self.send_response(status)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    # Send an API reply, with an ETag made from its contents and a
+    # Last-Modified time. Unless --no-validators is given, a request that
+    # already has a copy gets a 304 with no body instead
+    def send_json(self, j):
+        body = json.dumps(j).encode()
+
+        if opts.no_validators:
+            self.send_body(body, "application/json;charset=utf-8")
+            return
+
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        match = self.headers.get("If-None-Match")
+
+        if match is not None:
+            unchanged = etag in [ t.strip() for t in match.split(",") ]
+        else:
+            unchanged = self.headers.get("If-Modified-Since") == started
+
+        if unchanged:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json;charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", started)
+        self.end_headers()
+        self.wfile.write(body)
+
+    # Send made-up JPEG data in pieces so that big "photos" don't need to be
+    # held in memory. Honours simple "bytes=N-" Range requests. With
+    # --bad-rate, some are an error page instead (with a 200 status)
+    def send_image(self, n, size, height, width):
+        if random.random() < opts.bad_rate:
+            self.send_body(b"<html>Something went wrong</html>", "text/html")
+            return
+
+        start = 0
+        rng = self.headers.get("Range", "")
+
+        if rng.startswith("bytes=") and rng.endswith("-"):
+            start = int(rng[6:-1])
+
+            if start >= size:
+                self.send_response(416)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+
+            self.send_response(206)
+            self.send_header("Content-Range", "bytes " + str(start) + "-" +
+                             str(size - 1) + "/" + str(size))
+        else:
+            self.send_response(200)
+
+        self.send_header("Content-Type", "image/jpeg")
+        self.send_header("Content-Length", str(size - start))
+        self.end_headers()
+
+        # Cut some transfers off half way through
+        end = size
+        if random.random() < opts.drop_rate:
+            end = start + (size - start) // 2
+            self.close_connection = True
+
+        # A JPEG file: a comment with the photo number in it, so that
+        # different photos have different contents, and headers giving the
+        # dimensions, then zeroes for the image data and the end marker
+        head = (b"\xff\xd8" +
+                b"\xff\xfe\x00\x0a" + n.to_bytes(8, "big") +
+                b"\xff\xc0\x00\x11\x08" + height.to_bytes(2, "big") +
+                width.to_bytes(2, "big") +
+                b"\x03\x01\x22\x00\x02\x11\x01\x03\x11\x01" +
+                b"\xff\xda\x00\x0c\x03\x01\x00\x02\x11\x03\x11\x00\x3f\x00")
+        head = head[:size - 2]
+        block = b"\0" * 65536
+        pos = start
+
+        while pos < end:
+            if pos < len(head):
+                data = head[pos:end]
+            elif pos < size - 2:
+                data = block[:min(len(block), min(size - 2, end) - pos)]
+            else:
+                data = b"\xff\xd9"[pos - (size - 2):end - (size - 2)]
+
+            self.wfile.write(data)
+            pos += len(data)
+
+    def do_GET(self):
+        time.sleep(opts.latency)
+
+        if random.random() < opts.error_rate:
+            self.send_body(b"<html>Service unavailable</html>", "text/html",
+                           503)
+            return
+
+        if over_rate():
+            self.send_response(429)
+            self.send_header("Retry-After", "1")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        url = urllib.parse.urlsplit(self.path)
+        query = urllib.parse.parse_qs(url.query)
+        start = int(query.get("start", [ "0" ])[0])
+        count = int(query.get("count", [ "100" ])[0])
+        parts = [ p for p in url.path.split("/") if p ]
+
+        if parts[:1] == [ "img" ] and len(parts) == 3:
+            # Image data
+            n = int(parts[1])
+            if parts[2] == "or":
+                self.send_image(n, photo_size(n), 1200, 1600)
+            else:
+                self.send_image(n, photo_size(n) // 16, 120, 160)
+        elif parts[:3] == [ "api", "v3", "groups" ] and len(parts) >= 5:
+            # API calls
+            if parts[4] == "albums" and len(parts) == 5:
+                end = min(start + count, opts.albums)
+                self.send_json({ "ygData": {
+                    "total": opts.albums,
+                    "albums": [ make_album(n) for n in range(start, end) ] } })
+            elif parts[4] == "albums" and len(parts) == 6:
+                n = int(parts[5]) - 1000
+                total = album_size(n)
+                end = min(start + count, total)
+                photos = [ make_photo(n + i * opts.albums)
+                           for i in range(start, end) ]
+                self.send_json({ "ygData": {
+                    "total": total,
+                    "photoGroupByDetails": [ { "photos": photos } ] } })
+            elif parts[4] == "photos":
+                end = min(start + count, opts.photos)
+                self.send_json({ "ygData": {
+                    "totalPhotos": opts.photos,
+                    "photos": [ make_photo(n) for n in range(start, end) ] } })
+            else:
+                self.send_json({ "ygError": { "httpStatus": 404,
+                                              "errorMessage": "Not found" } })
+        else:
+            self.send_body(b"<html>Not found</html>", "text/html", 404)
+
+class Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    # Clients hanging up on us is normal when they're being killed or have
+    # been sent a truncated photo
+    def handle_error(self, request, client_address):
+        pass
+
+def main():
+    global opts
+
+    parser = argparse.ArgumentParser(
+        description = "Stand-in Yahoo! Groups photo API server")
+
+    parser.add_argument("--host", default = "127.0.0.1")
+    parser.add_argument("--port", type = int, default = 8000)
+    parser.add_argument("--albums", help = "Number of albums (default 10)",
+                        type = int, default = 10)
+    parser.add_argument("--photos", help = "Number of photos (default 1000)",
+                        type = int, default = 1000)
+    parser.add_argument("--size", help = "Size in bytes of each full-size "
+                                         "photo (default 65536)",
+                        type = int, default = 65536)
+    parser.add_argument("--size-spread", help = "Vary photo sizes at random by "
+                                                "up to this fraction of --size "
+                                                "either way (default 0)",
+                        type = float, default = 0)
+    parser.add_argument("--text-size", help = "Pad descriptions out to this "
+                                              "many characters (default 0)",
+                        type = int, default = 0)
+    parser.add_argument("--latency", help = "Seconds to wait before answering "
+                                            "each request (default 0)",
+                        type = float, default = 0)
+    parser.add_argument("--error-rate", help = "Fraction of requests to answer "
+                                               "with a 503 error (default 0)",
+                        type = float, default = 0)
+    parser.add_argument("--drop-rate", help = "Fraction of photo downloads to "
+                                              "cut off half way (default 0)",
+                        type = float, default = 0)
+    parser.add_argument("--bad-rate", help = "Fraction of photo downloads to "
+                                             "answer with an error page "
+                                             "instead, but a 200 status "
+                                             "(default 0)",
+                        type = float, default = 0)
+    parser.add_argument("--throttle", help = "Answer with 429 once there have "
+                                             "been more than N requests in "
+                                             "the last second",
+                        type = int, default = 0, metavar = "N")
+    parser.add_argument("--duplicates", help = "Make every Nth photo a copy of "
+                                               "an earlier one in another album",
+                        type = int, default = 0, metavar = "N")
+    parser.add_argument("--edited", help = "Give every Nth photo a later "
+                                           "modification date",
+                        type = int, default = 0, metavar = "N")
+    parser.add_argument("--no-validators", help = "Don't send ETag or "
+                                                  "Last-Modified headers, or "
+                                                  "answer conditional requests",
+                        action = "store_true")
+    parser.add_argument("--verbose", "-v", help = "Log every request",
+                        action = "store_true")
+
+    opts = parser.parse_args()
+
+    server = Server((opts.host, opts.port), Handler)
+    print("Serving on http://" + opts.host + ":" + str(opts.port) + "/",
+          flush = True)
+    server.serve_forever()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+
+# Run yahoo-photos-dl.py end to end against the stand-in server in a set of
+# typical situations, and report how long the listing and the downloads took,
+# how fast the photos came in and how much memory the script needed. Run it
+# before and after a change to see what difference the change made:
+#
+#   bench/scenarios.py                        # everything
+#   bench/scenarios.py small flaky            # just these
+#   bench/scenarios.py --list                 # what there is
+#   bench/scenarios.py -- --engine async      # pass options to the script
+
+import argparse
+import os
+import pathlib
+import subprocess
+import sys
+import tempfile
+import time
+
+here = pathlib.Path(__file__).resolve().parent
+script = here.parent / "yahoo-photos-dl.py"
+server = here / "mock-yg-server.py"
+
+# Each scenario is a description, the options for the server and the steps to
+# time: "list" lists every photo ID, "download" runs --download-all
+scenarios = {
+    "small":        ("1000 small photos",
+                     [ "--photos", "1000", "--size", "65536",
+                       "--latency", "0.01" ],
+                     [ "list", "download" ]),
+    "big-listing":  ("50000 photos in 500 albums with long descriptions",
+                     [ "--photos", "50000", "--albums", "500",
+                       "--text-size", "1000", "--latency", "0.05" ],
+                     [ "list" ]),
+    "large-photos": ("40 photos of 4-12 MiB",
+                     [ "--photos", "40", "--size", str(8 * 2**20),
+                       "--size-spread", "0.5" ],
+                     [ "download" ]),
+    "slow-server":  ("2000 photos with 100ms latency",
+                     [ "--photos", "2000", "--latency", "0.1",
+                       "--size-spread", "0.5" ],
+                     [ "list", "download" ]),
+    "flaky":        ("1000 photos with errors, dropped connections and "
+                     "throttling",
+                     [ "--photos", "1000", "--latency", "0.01",
+                       "--error-rate", "0.05", "--drop-rate", "0.05",
+                       "--throttle", "200" ],
+                     [ "list", "download" ]),
+}
+
+parser = argparse.ArgumentParser(description = "Run benchmark scenarios")
+parser.add_argument("scenarios", nargs = "*", metavar = "SCENARIO",
+                    help = "Scenarios to run (default all)")
+parser.add_argument("--list", help = "List the scenarios",
+                    action = "store_true")
+parser.add_argument("--port", type = int, default = 8805)
+parser.add_argument("--jobs", type = int, default = 16)
+
+# Anything after -- is for yahoo-photos-dl.py
+argv = sys.argv[1:]
+extra = []
+if "--" in argv:
+    extra = argv[argv.index("--") + 1:]
+    argv = argv[:argv.index("--")]
+
+args = parser.parse_args(argv)
+
+if args.list:
+    for name, (desc, _, steps) in scenarios.items():
+        print("{:<14} {} ({})".format(name, desc, ", ".join(steps)))
+    sys.exit()
+
+for name in args.scenarios:
+    if name not in scenarios:
+        parser.error("no scenario called " + name)
+
+# The number of photos the server is going to make up
+def photo_count(serverargs):
+    return int(serverargs[serverargs.index("--photos") + 1])
+
+# Run the script to completion, returning the elapsed time and its peak
+# memory use in MiB
+def run(cmd, cwd):
+    t = time.perf_counter()
+    proc = subprocess.Popen(cmd, cwd = cwd, stdout = subprocess.DEVNULL)
+    _, status, usage = os.wait4(proc.pid, 0)
+    elapsed = time.perf_counter() - t
+    proc.returncode = os.waitstatus_to_exitcode(status)
+
+    if proc.returncode:
+        print("  (exited with status " + str(proc.returncode) + ")")
+
+    return elapsed, usage.ru_maxrss / 1024
+
+print("{:<14} {:<9} {:>8} {:>10} {:>8} {:>9}".format(
+          "scenario", "step", "seconds", "photos/s", "MB/s", "peak MiB"))
+
+for name in args.scenarios or scenarios:
+    desc, serverargs, steps = scenarios[name]
+    photos = photo_count(serverargs)
+
+    srv = subprocess.Popen([ sys.executable, str(server),
+                             "--port", str(args.port) ] + serverargs,
+                           stdout = subprocess.PIPE, text = True)
+    srv.stdout.readline()
+
+    base = [ sys.executable, str(script), "bench", "--no-cookies",
+             "--api-base", "http://127.0.0.1:" + str(args.port) +
+             "/api/v3/groups/", "--jobs", str(args.jobs) ] + extra
+
+    try:
+        for step in steps:
+            with tempfile.TemporaryDirectory() as tmp:
+                if step == "list":
+                    elapsed, peak = run(base + [ "--list-photo-ids" ], tmp)
+                    mb = 0
+                else:
+                    elapsed, peak = run(base + [ "--download-all" ], tmp)
+                    mb = sum(f.stat().st_size for f in
+                             pathlib.Path(tmp).glob("*/*")) / 1e6
+
+            print("{:<14} {:<9} {:8.2f} {:10.1f} {:8.2f} {:9.1f}".format(
+                      name, step, elapsed, photos / elapsed, mb / elapsed,
+                      peak))
+    finally:
+        srv.terminate()
+        srv.wait()
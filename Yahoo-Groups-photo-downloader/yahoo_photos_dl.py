@@ -0,0 +1,4311 @@
+# Hacky script to dump photos from a Yahoo group. This is the code for
+# yahoo-photos-dl.py, which is what to run
+
+import argparse
+import atexit
+import importlib.util
+import sys
+import pathlib
+import string
+import csv
+import collections
+import functools
+import random
+import re
+import threading
+import hashlib
+import io
+import json
+import os
+import shutil
+import struct
+import time
+from datetime import datetime, timedelta, timezone
+
+# Load a module the first time something in it is used rather than straight
+# away, so that quick runs like --help don't have to wait for big libraries
+# to load. Returns None if the module isn't installed. The modules that come
+# with Python but are still slow to load (sqlite3, concurrent.futures and so
+# on) are imported in the functions that use them instead, as a module loaded
+# this way can't safely be used for the first time by two threads at once
+def lazy_import(name):
+    if name in sys.modules:
+        return sys.modules[name]
+
+    spec = importlib.util.find_spec(name)
+
+    if spec is None:
+        return None
+
+    spec.loader = importlib.util.LazyLoader(spec.loader)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+
+    return module
+
+browser_cookie3 = lazy_import("browser_cookie3")
+requests = lazy_import("requests")
+asyncio = lazy_import("asyncio")
+
+# aiohttp is only needed for --engine async
+aiohttp = lazy_import("aiohttp")
+
+# These are only needed for --archive
+tarfile = lazy_import("tarfile")
+zipfile = lazy_import("zipfile")
+
+# This is only needed for --verify
+multiprocessing = lazy_import("multiprocessing")
+
+# Speed things up by using an HTTP session. It isn't set up until it's first
+# needed (see get_session), so that runs which never talk to the server don't
+# need requests at all
+session = None
+session_lock = threading.Lock()
+
+# How many connections the session should keep open, which main() sets to
+# cover the number of threads that are going to be sharing it
+pool_size = 10
+
+# The browser we're pretending to be, if any
+user_agent = None
+
+# Where the API lives. This can be overridden with --api-base so the script can
+# be pointed at a local stand-in server for testing and benchmarking
+api_base = "https://groups.yahoo.com/api/v3/groups/"
+
+# How many items to ask for in each page of a listing, and how many pages to
+# fetch at once. Set with --page-size and --list-jobs
+page_size = 100
+list_jobs = 4
+
+# The HTTP session, setting it up if this is the first time it's been asked
+# for. The lock also makes sure requests is only loaded by one thread
+def get_session():
+    global session
+
+    with session_lock:
+        if session is None:
+            session = requests.Session()
+
+            adapter = requests.adapters.HTTPAdapter(
+                          pool_connections = pool_size,
+                          pool_maxsize = pool_size)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+
+            if user_agent:
+                session.headers.update({ "User-Agent": user_agent })
+
+    return session
+
+# The BrowserCookies class below, which is only made the first time it's
+# needed, as it's based on http.cookiejar and that's slow to load
+@functools.cache
+def browser_cookies_class():
+    import http.cookiejar
+
+    # Login cookies from a browser. Reading them means going through (and
+    # for Chrome, decrypting) the browser's whole cookie database, which is
+    # slow, so it's put off until a request actually needs them - with
+    # --cache a run might never talk to the server - and only Yahoo's cookies
+    # are read. With a cache file they're also saved there for later runs,
+    # which use them until the first one expires (or for a day at most, since
+    # session cookies don't say when they expire).
+    class BrowserCookies(http.cookiejar.CookieJar):
+        names = { "chrome": "Chrome/Chromium", "firefox": "Firefox" }
+        max_age = 24 * 3600
+
+        def __init__(self, browser, cachefile = None):
+            super().__init__()
+            self.browser = browser
+            self.cachefile = cachefile
+            self.loaded = False
+            self.load_lock = threading.Lock()
+
+        def load(self):
+            with self.load_lock:
+                if self.loaded:
+                    return
+
+                jar = self.read_cache()
+
+                if jar is None:
+                    print("\nLoading " + self.names[self.browser] +
+                          " cookies...")
+                    jar = getattr(browser_cookie3, self.browser)(
+                              domain_name = "yahoo.com")
+
+                    if self.cachefile:
+                        self.write_cache(jar)
+                else:
+                    print("\nUsing " + self.names[self.browser] + " cookies "
+                          "saved in " + self.cachefile)
+
+                for cookie in jar:
+                    self.set_cookie(cookie)
+
+                self.loaded = True
+
+        # The cookies from the cache file, or None if there aren't any usable
+        # ones
+        def read_cache(self):
+            if not self.cachefile:
+                return None
+
+            jar = http.cookiejar.LWPCookieJar()
+
+            try:
+                with open(self.cachefile) as f:
+                    f.readline()
+                    browser = f.readline()
+
+                age = time.time() - os.stat(self.cachefile).st_mtime
+                jar.load(self.cachefile, ignore_discard = True,
+                         ignore_expires = True)
+            except (OSError, http.cookiejar.LoadError):
+                return None
+
+            if browser.strip() != "# browser: " + self.browser or \
+               age > self.max_age or len(jar) == 0 or \
+               any(cookie.is_expired() for cookie in jar):
+                return None
+
+            return jar
+
+        def write_cache(self, jar):
+            lwp = http.cookiejar.LWPCookieJar()
+
+            for cookie in jar:
+                lwp.set_cookie(cookie)
+
+            # They're login cookies, so keep them to ourselves
+            fd = os.open(self.cachefile, os.O_WRONLY | os.O_CREAT | os.O_TRUNC,
+                         0o600)
+
+            with open(fd, "w") as f:
+                f.write("#LWP-Cookies-2.0\n# browser: " + self.browser + "\n")
+                f.write(lwp.as_lwp_str(ignore_discard = True,
+                                       ignore_expires = True))
+
+        # These are how requests and the async engine get at the cookies
+        def __iter__(self):
+            self.load()
+            return super().__iter__()
+
+        def __len__(self):
+            self.load()
+            return super().__len__()
+
+        def add_cookie_header(self, request):
+            self.load()
+            super().add_cookie_header(request)
+
+    return BrowserCookies
+
+# Make a BrowserCookies for the given browser ("chrome" or "firefox")
+def browser_cookies(browser, cachefile = None):
+    return browser_cookies_class()(browser, cachefile)
+
+# Keeps the request rate down to what the server is happy with. This is a
+# token bucket whose rate adjusts itself: there's no limit at all until the
+# server first tells us to slow down (see fetch below), at which point the
+# rate is set to half of what we were managing at the time. After that every
+# successful request nudges the rate back up a little, and every further
+# complaint halves it again.
+class RateLimiter:
+    def __init__(self, rate = None, burst = 4, min_rate = 0.5):
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.last_cut = 0
+        self.recent = collections.deque()
+        self.lock = threading.Lock()
+
+    # Book a slot for a request and return how long to wait before making it
+    def reserve(self):
+        with self.lock:
+            now = time.monotonic()
+
+            # Keep track of how many requests went out in the last second
+            self.recent.append(now)
+            while self.recent[0] < now - 1:
+                self.recent.popleft()
+
+            if self.rate is None:
+                return 0
+
+            self.tokens = min(self.burst, self.tokens +
+                              (now - self.updated) * self.rate)
+            self.updated = now
+
+            # Take a token, going into debt if there isn't one. Anyone else
+            # who comes along has to wait until the debt is paid off too
+            self.tokens -= 1
+            return -self.tokens / self.rate if self.tokens < 0 else 0
+
+    # Wait until we're allowed to make a request
+    def wait(self):
+        delay = self.reserve()
+
+        if delay:
+            time.sleep(delay)
+
+    def succeeded(self):
+        with self.lock:
+            if self.rate is not None:
+                self.rate += 1 / self.rate
+
+    def throttled(self):
+        with self.lock:
+            now = time.monotonic()
+
+            # When lots of requests are in flight they'll all get throttled
+            # together, which should only count as one complaint
+            if now - self.last_cut < 1:
+                return
+
+            self.last_cut = now
+            current = len(self.recent)
+
+            if self.rate is not None:
+                current = min(current, self.rate)
+
+            self.rate = max(self.min_rate, current / 2)
+
+limiter = RateLimiter()
+
+# How many times to try a request again if it fails in a way that might be
+# temporary, and the delay before the first retry in seconds. The delay
+# doubles with every retry. Set with --retries
+retries = 5
+retry_delay = 1.0
+
+# HTTP statuses that mean the server is busy or broken rather than that we've
+# asked for something we can't have
+retry_statuses = { 429, 500, 502, 503, 504 }
+
+# How long to wait in seconds for a connection to the server, and then for
+# each piece of the response, before giving up on that attempt. A connection
+# that stalls is retried the same way as one that drops
+connect_timeout = 30
+read_timeout = 60
+
+# The longest we'll wait in seconds when a server asks us to with
+# Retry-After
+max_retry_after = 300
+
+# How long to wait before the given retry (counting from 0). This is chosen
+# at random up to the exponential backoff time, so that lots of threads which
+# failed together don't all try again together
+def backoff(attempt):
+    return random.uniform(0, min(60, retry_delay * 2 ** attempt))
+
+# How long the server asked us to wait, from the Retry-After header in a
+# response's headers, if at all (but no longer than max_retry_after)
+def retry_after(headers):
+    value = headers.get("Retry-After")
+
+    if not value:
+        return None
+
+    try:
+        delay = float(value)
+    except ValueError:
+        import email.utils
+
+        try:
+            when = email.utils.parsedate_to_datetime(value)
+            delay = (when - datetime.now(timezone.utc)).total_seconds()
+        except (TypeError, ValueError):
+            return None
+
+    return min(max(0, delay), max_retry_after)
+
+# The timing of one API call or download, for --stats and --trace
+class Timing:
+    __slots__ = ("kind", "url", "start", "bytes", "retries")
+
+    def __init__(self, kind, url):
+        self.kind = kind
+        self.url = url
+        self.start = time.perf_counter()
+        self.bytes = 0
+        self.retries = []
+
+    # Note down why a request had to be retried (a status code or exception)
+    def retried(self, reason):
+        self.retries.append(str(reason))
+
+# The value below which p percent of the (sorted) values fall
+def percentile(values, p):
+    return values[max(0, -(-len(values) * p // 100) - 1)]
+
+# Collects timings of requests from all the threads (or the async engine) and
+# sums them up at the end of the run. With a trace file, each request is also
+# written out as a line of JSON as it finishes.
+class Stats:
+    def __init__(self, tracefile = None):
+        self.lock = threading.Lock()
+        self.begun = time.perf_counter()
+        self.latencies = collections.defaultdict(list)
+        self.bytes = collections.Counter()
+        self.statuses = collections.Counter()
+        self.retries = collections.Counter()
+        self.pages = 0
+        self.listing_time = 0
+        self.trace = open(tracefile, "w") if tracefile else None
+
+    def start(self, kind, url):
+        return Timing(kind, url)
+
+    # Record a request that's finished with the given status (0 if we
+    # couldn't talk to the server)
+    def finish(self, timing, status):
+        seconds = time.perf_counter() - timing.start
+
+        with self.lock:
+            self.latencies[timing.kind].append(seconds)
+            self.bytes[timing.kind] += timing.bytes
+            self.statuses[(timing.kind, status)] += 1
+            self.retries.update(timing.retries)
+
+            if self.trace:
+                self.trace.write(json.dumps({
+                    "start":   round(timing.start - self.begun, 6),
+                    "kind":    timing.kind,
+                    "url":     timing.url,
+                    "seconds": round(seconds, 6),
+                    "bytes":   timing.bytes,
+                    "status":  status,
+                    "retries": timing.retries }) + "\n")
+
+    # Record a listing that took the given number of pages
+    def listed(self, pages, seconds):
+        with self.lock:
+            self.pages += pages
+            self.listing_time += seconds
+
+    def report(self):
+        elapsed = time.perf_counter() - self.begun
+
+        print("\nRequest statistics over " + "{:.2f}".format(elapsed) + "s:")
+        print("  {:<10} {:>7} {:>9} {:>9} {:>9} {:>10} {:>8}".format(
+                  "", "count", "p50 ms", "p95 ms", "p99 ms", "MB", "MB/s"))
+
+        for kind, latencies in sorted(self.latencies.items()):
+            latencies.sort()
+            print("  {:<10} {:7} {:9.1f} {:9.1f} {:9.1f} {:10.2f} {:8.2f}".format(
+                      kind, len(latencies),
+                      percentile(latencies, 50) * 1000,
+                      percentile(latencies, 95) * 1000,
+                      percentile(latencies, 99) * 1000,
+                      self.bytes[kind] / 1e6,
+                      self.bytes[kind] / 1e6 / elapsed))
+
+        if self.pages:
+            print("  Listing:  " + str(self.pages) + " pages in " +
+                  "{:.2f}s ({:.1f} pages/s)".format(
+                      self.listing_time,
+                      self.pages / max(self.listing_time, 1e-9)))
+
+        if self.retries:
+            print("  Retries:  " + str(sum(self.retries.values())) + " (" +
+                  ", ".join(reason + ": " + str(n) for reason, n in
+                            self.retries.most_common()) + ")")
+
+        errors = [ (kind + " " + ("no connection" if status == 0
+                                  else str(status)), n)
+                   for (kind, status), n in self.statuses.most_common()
+                   if status not in (200, 206, 304) ]
+
+        unchanged = sum(n for (kind, status), n in self.statuses.items()
+                        if status == 304)
+
+        if unchanged:
+            print("  Unchanged: " + str(unchanged) + " replies taken from "
+                  "the --http-cache")
+
+        if errors:
+            print("  Errors:   " + ", ".join(what + ": " + str(n)
+                                             for what, n in errors))
+
+    def close(self):
+        self.report()
+
+        if self.trace:
+            self.trace.close()
+
+# Set up by main() if --stats or --trace is given
+stats = None
+
+# Make a GET request through the session, keeping to the rate limit. Busy
+# server responses and connection problems (including connections that stall
+# for longer than the timeouts) are retried with backoff, up to
+# the retry limit. Returns the response (which may still be an error if we
+# ran out of retries) or raises the last exception from requests. Retries are
+# noted in timing, if given
+def fetch(url, cookiejar, headers = None, stream = False, timing = None):
+    attempt = 0
+
+    while True:
+        limiter.wait()
+
+        try:
+            response = get_session().get(url, cookies = cookiejar,
+                                         headers = headers, stream = stream,
+                                         timeout = (connect_timeout,
+                                                    read_timeout))
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if attempt >= retries:
+                raise
+
+            if timing:
+                timing.retried(type(e).__name__)
+
+            time.sleep(backoff(attempt))
+            attempt += 1
+            continue
+
+        if response.status_code not in retry_statuses:
+            limiter.succeeded()
+            return response
+
+        # A 429 always means slow down. A 503 might just mean the server's
+        # broken, unless it says when to come back
+        delay = retry_after(response.headers)
+
+        if response.status_code == 429 or delay is not None:
+            limiter.throttled()
+
+        if attempt >= retries:
+            return response
+
+        if timing:
+            timing.retried(response.status_code)
+
+        response.close()
+        time.sleep(backoff(attempt) if delay is None else delay)
+        attempt += 1
+
+# Work out what an API response means. Takes the HTTP status and reason, the
+# content type and a function that returns the decoded JSON
+def yg_result(status, reason, ctype, getjson):
+    if status in retry_statuses:
+        # The server was still busy or broken after all our retries
+        result = { "result": "error",
+                   "status": status,
+                   "message": reason }
+    elif ctype != "application/json":
+        # We didn't get a JSON response - assume login required
+        result = { "result": "no-access" }
+    else:
+        # Get the JSON content
+        j = getjson()
+
+        if "ygError" in j:
+            # The server returned an error - return the status code
+            result = { "result": "error",
+                       "status": int(j["ygError"]["httpStatus"]),
+                       "message": j["ygError"]["errorMessage"] }
+        elif "ygData" not in j:
+            # There wasn't an error but no data was present in the reply
+            result = { "result": "no-data" }
+        else:
+            result = { "result": "success",
+                       "data": j["ygData"] }
+
+    return result
+
+# A cache of API replies for --http-cache, kept in an SQLite database, so
+# that listing a group again only downloads the pages that have changed. Each
+# JSON reply that came with an ETag or Last-Modified header is stored against
+# its URL, and the next request for that URL asks for it only if it doesn't
+# match them. A 304 reply means the stored copy is still good. The replies
+# that were used longest ago are dropped to keep the total under max_bytes.
+# It's shared between the listing threads, so access is serialised
+class HttpCache:
+    def __init__(self, filename, max_bytes):
+        import sqlite3
+
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(filename, check_same_thread = False)
+        self.db.executescript("""
+            PRAGMA journal_mode = WAL;
+            PRAGMA synchronous = NORMAL;
+            CREATE TABLE IF NOT EXISTS replies (
+                url TEXT PRIMARY KEY, etag TEXT, modified TEXT, ctype TEXT,
+                body BLOB, size INTEGER, used REAL);
+            CREATE INDEX IF NOT EXISTS replies_used ON replies (used);
+            """)
+        self.size = self.db.execute("SELECT COALESCE(SUM(size), 0) "
+                                    "FROM replies").fetchone()[0]
+
+    # The stored reply for an URL as (ETag, Last-Modified, content type,
+    # body), or None
+    def get(self, url):
+        with self.lock, self.db:
+            self.db.execute("UPDATE replies SET used = ? WHERE url = ?",
+                            (time.time(), url))
+            return self.db.execute("SELECT etag, modified, ctype, body "
+                                   "FROM replies WHERE url = ?",
+                                   (url,)).fetchone()
+
+    # Headers that ask for an URL only if it isn't the same as a stored reply
+    def validators(self, cached):
+        etag, modified = cached[:2]
+        headers = {}
+
+        if etag:
+            headers["If-None-Match"] = etag
+        if modified:
+            headers["If-Modified-Since"] = modified
+
+        return headers
+
+    # Store a reply if it has anything to validate it with
+    def put(self, url, headers, ctype, body):
+        etag = headers.get("ETag")
+        modified = headers.get("Last-Modified")
+
+        if not etag and not modified:
+            return
+
+        with self.lock, self.db:
+            old = self.db.execute("SELECT size FROM replies WHERE url = ?",
+                                  (url,)).fetchone()
+            self.db.execute("INSERT OR REPLACE INTO replies "
+                            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                            (url, etag, modified, ctype, body, len(body),
+                             time.time()))
+            self.size += len(body) - (old[0] if old else 0)
+
+            if self.size > self.max_bytes:
+                self.evict()
+
+    def evict(self):
+        dropped = []
+
+        for url, size in self.db.execute("SELECT url, size FROM replies "
+                                         "ORDER BY used"):
+            if self.size <= self.max_bytes:
+                break
+
+            dropped.append((url,))
+            self.size -= size
+
+        self.db.executemany("DELETE FROM replies WHERE url = ?", dropped)
+
+# Set up by main() if --http-cache is given
+http_cache = None
+
+# Fetch the JSON data from an API url
+def get_yg_data(url, cookiejar):
+    timing = stats.start("api", url) if stats else None
+    cached = http_cache.get(url) if http_cache else None
+
+    try:
+        response = fetch(url, cookiejar,
+                         http_cache.validators(cached) if cached else None,
+                         timing = timing)
+    except requests.RequestException as e:
+        if timing:
+            stats.finish(timing, 0)
+
+        # We couldn't even talk to the server
+        return { "result": "error",
+                 "status": 0,
+                 "message": str(e) }
+
+    if timing:
+        timing.bytes = len(response.content)
+        stats.finish(timing, response.status_code)
+
+    if cached and response.status_code == 304:
+        return yg_result(200, "OK", cached[2], lambda: json.loads(cached[3]))
+
+    # Extract the content type of the returned document
+    ctype = response.headers.get("Content-Type", "").split(';')[0]
+
+    if http_cache and response.status_code == 200 and \
+       ctype == "application/json":
+        http_cache.put(url, response.headers, ctype, response.content)
+
+    return yg_result(response.status_code, response.reason, ctype,
+                     response.json)
+
+# Find out the number of albums and photos in the group
+def get_group_stats(groupname, cookiejar):
+    # Make a tentative request for just one album
+    j = get_yg_data(api_base +
+                    groupname + "/albums?start=0&count=1",
+                    cookiejar)
+
+    if j["result"] != "success":
+        # An error occurred - just return it as-is
+        result = j
+    else:
+        albumCount = int(j["data"]["total"])
+
+        # Now try requesting just one photo
+        j = get_yg_data(api_base +
+                        groupname + "/photos?start=0&count=1",
+                        cookiejar)
+
+        if j["result"] != "success":
+            # An error occurred
+            result = j
+        else:
+            photoCount = int(j["data"]["totalPhotos"])
+
+            result = { "result": "success",
+                       "albums": albumCount,
+                       "photos": photoCount }
+
+    return result
+
+# Format a Unix timestamp the same way as str() does a UTC datetime, but
+# quicker, as it's done twice for every row when writing out big listings.
+# The date part is only worked out once for each day, and the time is pieced
+# together from tables
+@functools.lru_cache(maxsize = 4096)
+def format_date(day):
+    return datetime.fromtimestamp(day * 86400,
+                                  timezone.utc).date().isoformat() + " "
+
+format_hours = [ "%02d:" % h for h in range(24) ]
+format_minsecs = [ "%02d:%02d+00:00" % divmod(n, 60) for n in range(3600) ]
+
+def format_time(timestamp):
+    if type(timestamp) is not int:
+        return str(datetime.fromtimestamp(timestamp, timezone.utc))
+
+    day, secs = divmod(timestamp, 86400)
+    hour, minsec = divmod(secs, 3600)
+
+    return format_date(day) + format_hours[hour] + format_minsecs[minsec]
+
+# Albums and photos are kept as objects with __slots__ rather than dicts, since
+# a big group can have a lot of photos and dicts take up a lot more memory. The
+# creation and modification times are kept as the timestamps the API gives us
+# and only turned into datetimes when they're asked for. fields lists the
+# attributes in the order they're written to CSV files
+class Album:
+    __slots__ = ("ID", "name", "creator", "description", "creationDate",
+                 "modificationDate", "photos")
+
+    fields = [ "ID", "name", "description", "creator", "created", "modified",
+               "photos" ]
+
+    def __init__(self, ID, name, creator, description, creationDate,
+                 modificationDate, photos):
+        self.ID = ID
+        self.name = name
+        self.creator = creator
+        self.description = description
+        self.creationDate = creationDate
+        self.modificationDate = modificationDate
+        self.photos = photos
+
+    @property
+    def created(self):
+        return datetime.fromtimestamp(self.creationDate, timezone.utc)
+
+    @property
+    def modified(self):
+        return datetime.fromtimestamp(self.modificationDate, timezone.utc)
+
+    # The values needed to recreate the album, e.g. for saving it as JSON
+    def values(self):
+        return [ getattr(self, a) for a in self.__slots__ ]
+
+    # The values for each of the fields, ready to be written out
+    def row(self):
+        return [ self.ID, self.name, self.description, self.creator,
+                 format_time(self.creationDate),
+                 format_time(self.modificationDate), self.photos ]
+
+# The height, width, size and URL are for the version of the photo that's
+# going to be downloaded, which is the biggest unless choose_variant has
+# picked another. The other versions the API offered are kept in variants,
+# packed into one string by pack_variants, as there can be millions of
+# photos and most of them are never looked at again (all_variants unpacks
+# them). Photos saved before variants were kept have None there
+class Photo:
+    __slots__ = ("ID", "albumID", "name", "filename", "filetype",
+                 "description", "creator", "creationDate", "modificationDate",
+                 "height", "width", "filesize", "url", "variants")
+
+    fields = [ "ID", "albumID", "name", "filename", "filetype", "description",
+               "creator", "created", "modified", "height", "width",
+               "filesize", "url" ]
+
+    def __init__(self, ID, albumID, name, filename, filetype, description,
+                 creator, creationDate, modificationDate, height, width,
+                 filesize, url, variants = None):
+        self.ID = ID
+        self.albumID = albumID
+        self.name = name
+        self.filename = filename
+        self.filetype = filetype
+        self.description = description
+        self.creator = creator
+        self.creationDate = creationDate
+        self.modificationDate = modificationDate
+        self.height = height
+        self.width = width
+        self.filesize = filesize
+        self.url = url
+        self.variants = variants
+
+    @property
+    def created(self):
+        return datetime.fromtimestamp(self.creationDate, timezone.utc)
+
+    @property
+    def modified(self):
+        return datetime.fromtimestamp(self.modificationDate, timezone.utc)
+
+    def values(self):
+        return [ getattr(self, a) for a in self.__slots__ ]
+
+    # All the versions of the photo as (height, width, size, URL) tuples,
+    # starting with the one that's going to be downloaded
+    def all_variants(self):
+        found = [ (self.height, self.width, self.filesize, self.url) ]
+
+        for line in (self.variants or "").splitlines():
+            height, width, size, shared, rest = line.split(",", 4)
+            found.append((unpack_number(height), unpack_number(width),
+                          unpack_number(size), self.url[:int(shared)] + rest))
+
+        return found
+
+    # A copy of the photo which downloads the given variant instead
+    def with_variant(self, variant):
+        photo = Photo(*self.values())
+        photo.height, photo.width, photo.filesize, photo.url = variant
+        photo.variants = pack_variants(photo.url,
+                                       [ v for v in self.all_variants()
+                                         if v != variant ])
+        return photo
+
+    def row(self):
+        return [ self.ID, self.albumID, self.name, self.filename,
+                 self.filetype, self.description, self.creator,
+                 format_time(self.creationDate),
+                 format_time(self.modificationDate), self.height, self.width,
+                 self.filesize, self.url ]
+
+# Raised by the iter_... listing functions when a page can't be fetched. The
+# reply from get_yg_data is in result. When the photos are being listed album
+# by album, albums holds the ones that couldn't be listed
+class ListingFailed(Exception):
+    def __init__(self, result, albums = ()):
+        super().__init__(result["result"])
+        self.result = result
+        self.albums = albums
+
+# Runs the work for --batch on one set of threads shared by all the groups.
+# Work is queued by group and kind ("list" or "download"), and the threads
+# take turns between the queues, so a group with a lot of photos queued up
+# can't hold the others up and listings keep moving while downloads are going
+# on. The number of threads is the cap on how much happens at once overall.
+class FairScheduler:
+    def __init__(self, jobs):
+        # Queues with work in them, in the order they'll next get a turn
+        self.queues = collections.OrderedDict()
+        self.ready = threading.Condition()
+
+        for _ in range(jobs):
+            threading.Thread(target = self.worker, daemon = True).start()
+
+    # Queue up fn(*args), returning a Future for the result
+    def submit(self, key, fn, *args):
+        import concurrent.futures
+
+        future = concurrent.futures.Future()
+
+        with self.ready:
+            self.queues.setdefault(key, collections.deque()).append(
+                (future, fn, args))
+            self.ready.notify()
+
+        return future
+
+    # Take the next piece of work, and send its queue to the back of the line
+    def next_work(self):
+        with self.ready:
+            while not self.queues:
+                self.ready.wait()
+
+            key, queue = self.queues.popitem(last = False)
+            work = queue.popleft()
+
+            if queue:
+                self.queues[key] = queue
+
+            return work
+
+    def worker(self):
+        while True:
+            future, fn, args = self.next_work()
+
+            if not future.set_running_or_notify_cancel():
+                continue
+
+            try:
+                future.set_result(fn(*args))
+            except BaseException as e:
+                future.set_exception(e)
+
+# Set up by main() for --batch
+scheduler = None
+
+# Start fetching a page of an API listing, with the async engine or the
+# --batch scheduler if we're using them, or otherwise in pool. In --batch
+# mode, group says which group the page is for. Returns a Future for what
+# get_yg_data makes of the reply
+def submit_page(pool, url, cookiejar, group = None):
+    if engine:
+        return engine.submit(engine.get_yg_data(url, cookiejar))
+    elif scheduler:
+        return scheduler.submit((group, "list"), get_yg_data, url, cookiejar)
+    else:
+        return pool.submit(get_yg_data, url, cookiejar)
+
+# Fetch every page of a paginated API listing, yielding each page's data in
+# order as soon as it has arrived. url should end with "?" or "&" so the start
+# and count parameters can be tacked on, and totalkey names the field in the
+# reply that says how many items there are altogether. If we already know
+# roughly how many there are (from get_group_stats) every page can be requested
+# straight away; otherwise the first page is fetched on its own to find out.
+# Up to list_jobs pages are fetched at once. Raises ListingFailed if a page
+# couldn't be fetched. In --batch mode, group says which group the pages are
+# being fetched for, so the scheduler can share the work out fairly
+def iter_yg_pages(url, cookiejar, totalkey, total = None, group = None):
+    import concurrent.futures
+
+    pending = collections.deque()
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers = list_jobs) as pool:
+        def submit(start):
+            return submit_page(pool, url + "start=" + str(start) +
+                               "&count=" + str(page_size), cookiejar, group)
+
+        # Wait for the next page
+        def next_page():
+            nonlocal pages
+            j = pending.popleft().result()
+
+            if j["result"] != "success":
+                raise ListingFailed(j)
+
+            pages += 1
+            return j["data"]
+
+        # For --stats. The time includes any waiting for the caller to deal
+        # with the pages, as that's how fast the listing went in practice
+        pages = 0
+        began = time.perf_counter()
+
+        try:
+            start = 0
+
+            if total is None:
+                pending.append(submit(0))
+                page = next_page()
+                total = int(page[totalkey])
+                start = page_size
+                yield page
+            else:
+                # Always ask for at least one page in case the estimate was
+                # wrong
+                total = max(total, 1)
+
+            # The total might go up as we go along, so keep going until we've
+            # covered whatever the server last told us
+            while pending or start < total:
+                while start < total and len(pending) < list_jobs:
+                    pending.append(submit(start))
+                    start += page_size
+
+                page = next_page()
+                total = max(total, int(page[totalkey]))
+                yield page
+        finally:
+            if stats:
+                stats.listed(pages, time.perf_counter() - began)
+
+# Yield all the albums in the group as they arrive. total is the number of
+# albums get_group_stats found, if known. Raises ListingFailed if something
+# goes wrong
+def iter_album_list(groupname, cookiejar, total = None):
+    for page in iter_yg_pages(api_base + groupname + "/albums?", cookiejar,
+                              "total", total, groupname):
+        for album in page["albums"]:
+            yield Album(album["albumId"],
+                        album["albumName"],
+                        album["creatorNickname"],
+                        album["description"],
+                        album["creationDate"],
+                        album["modificationDate"],
+                        int(album["total"]))
+
+# Get a list of all the albums in the group
+def get_album_list(groupname, cookiejar, total = None):
+    try:
+        return list(iter_album_list(groupname, cookiejar, total))
+    except ListingFailed:
+        # An error occurred. I'm too lazy to deal with it properly.
+        # Just bail out with an empty list
+        return []
+
+def list_albums_long(albums):
+    for album in albums:
+        print("\nAlbum ID:      " + str(album.ID))
+        print("Album name:    " + album.name)
+        print("Description:   " + album.description)
+        print("Created by:    " + album.creator)
+        print("Creation time: " + str(album.created))
+        print("Last modified: " + str(album.modified))
+        print("No. of photos: " + str(album.photos))
+
+# Writes out a table - albums, photos or the --download-all log - with rows
+# saved up and written in batches. The format depends on the filename: JSON
+# Lines for ".jsonl", Parquet for ".parquet" (if pyarrow is installed;
+# otherwise it falls back to CSV, saved with a ".csv" extension instead) and
+# CSV for anything else. The file actually written is in filename. Rows can be
+# written as they arrive; with flush_interval set, they're also written out at
+# least every that many seconds, so a long run's log is kept up to date.
+# writerow() and writerows() work like a csv.writer's. Closing it more than
+# once is fine, so main() can make sure it's closed on the way out (whatever
+# the exit) as well as when it's finished with
+class TableWriter:
+    def __init__(self, filename, fields, flush_interval = None,
+                 batch_size = 10000):
+        self.filename = str(filename)
+        self.fields = fields
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.batch = []
+        self.flushed = time.monotonic()
+        self.format = "csv"
+        self.closed = False
+
+        if self.filename.endswith(".jsonl"):
+            self.format = "jsonl"
+        elif self.filename.endswith(".parquet"):
+            try:
+                import pyarrow
+                import pyarrow.parquet
+                self.format = "parquet"
+                self.pyarrow = pyarrow
+                self.parquet = None
+            except ImportError:
+                self.filename = str(pathlib.Path(self.filename)
+                                    .with_suffix(".csv"))
+                print("\npyarrow isn't installed, so saving as CSV in " +
+                      self.filename + " instead.")
+
+        if self.format == "csv":
+            self.file = open(self.filename, 'w', newline='',
+                             buffering = 1024 * 1024)
+            self.writer = csv.writer(self.file)
+            self.writer.writerow(fields)
+        elif self.format == "jsonl":
+            self.file = open(self.filename, 'w', buffering = 1024 * 1024)
+            self.encoder = json.JSONEncoder(ensure_ascii = False,
+                                            default = str)
+
+    def writerow(self, row):
+        self.batch.append(row)
+
+        if len(self.batch) >= self.batch_size or \
+           (self.flush_interval is not None and
+            time.monotonic() - self.flushed >= self.flush_interval):
+            self.flush()
+
+    def writerows(self, rows):
+        for row in rows:
+            self.writerow(row)
+
+    # Write out the rows saved up so far
+    def flush(self):
+        if self.batch:
+            getattr(self, "write_" + self.format)(self.batch)
+            self.batch = []
+
+        if self.format != "parquet":
+            self.file.flush()
+
+        self.flushed = time.monotonic()
+
+    # Most rows don't need any quoting, and joining them up ourselves is
+    # quicker than the csv module. Anything that might need quoting (or has
+    # a None in it, which csv writes as an empty field) goes through it as
+    # usual, in order
+    def write_csv(self, rows):
+        commas = len(self.fields) - 1
+        lines = []
+
+        for row in rows:
+            if None not in row:
+                line = ",".join(map(str, row))
+
+                if line.count(",") == commas and '"' not in line and \
+                   "\n" not in line and "\r" not in line:
+                    lines.append(line + "\r\n")
+                    continue
+
+            if lines:
+                self.file.write("".join(lines))
+                lines = []
+
+            self.writer.writerow(row)
+
+        self.file.write("".join(lines))
+
+    def write_jsonl(self, rows):
+        encode = self.encoder.encode
+        fields = self.fields
+
+        self.file.write("".join([ encode(dict(zip(fields, row))) + "\n"
+                                  for row in rows ]))
+
+    # Each batch becomes a row group. The column types come from the first
+    # batch
+    def write_parquet(self, rows):
+        columns = { f: list(column) for f, column in
+                    zip(self.fields, zip(*rows)) }
+
+        if self.parquet is None:
+            table = self.pyarrow.table(columns)
+            self.parquet = self.pyarrow.parquet.ParquetWriter(self.filename,
+                                                              table.schema)
+        else:
+            table = self.pyarrow.table(columns, schema = self.parquet.schema)
+
+        self.parquet.write_table(table)
+
+    def close(self):
+        if self.closed:
+            return
+
+        self.closed = True
+        self.flush()
+
+        if self.format == "parquet":
+            if self.parquet is None:
+                # No rows at all - write an empty table with the right columns
+                self.pyarrow.parquet.write_table(
+                    self.pyarrow.table({ f: [] for f in self.fields }),
+                    self.filename)
+            else:
+                self.parquet.close()
+        else:
+            self.file.close()
+
+# Returns the name of the file actually written
+def list_albums_csv(albums, filename):
+    writer = TableWriter(filename, Album.fields)
+    writer.writerows(a.row() for a in albums)
+    writer.close()
+
+    return writer.filename
+
+def list_album_ids(albums):
+    print("\nID          Photos  Name")
+    print(  "==          ======  ====")
+    for album in albums:
+        print("{:<10}  {:>6}  {}".format(album.ID,
+                                         album.photos,
+                                         album.name))
+
+# Pack the (height, width, size, URL) tuples for the versions of a photo
+# other than the one at url into a string for Photo.variants: a line for
+# each, of its height, width and size, how much of url its URL starts with,
+# and the rest of its URL, separated by commas
+def pack_variants(url, variants):
+    lines = []
+
+    for height, width, size, other in variants:
+        shared = shared_length(url, other)
+        lines.append("{},{},{},{},{}".format(
+                         pack_number(height), pack_number(width),
+                         pack_number(size), shared, other[shared:]))
+
+    return "\n".join(lines)
+
+# How many characters at the start of a and b are the same. Found by halving
+# rather than comparing them one at a time, which is slow in Python
+def shared_length(a, b):
+    low, high = 0, min(len(a), len(b))
+
+    while low < high:
+        middle = (low + high + 1) // 2
+
+        if a.startswith(b[:middle]):
+            low = middle
+        else:
+            high = middle - 1
+
+    return low
+
+def pack_number(n):
+    return "" if n is None else str(n)
+
+def unpack_number(s):
+    return int(s) if s else None
+
+# Turn a photo from the API into our own format
+def make_photo_record(photo):
+    # Find the biggest version of the photo
+    photoInfo = { "height": 0 }
+    for v in photo["photoInfo"]:
+        if v["height"] > photoInfo["height"]:
+            photoInfo = v
+
+    variants = pack_variants(photoInfo["displayURL"],
+                             [ (v["height"], v["width"], v["size"],
+                                v["displayURL"])
+                               for v in photo["photoInfo"]
+                               if v is not photoInfo ])
+
+    return Photo(photo["photoId"],
+                 photo["albumId"],
+                 photo["photoName"],
+                 photo["photoFilename"],
+                 photo["fileType"],
+                 "" if "description" not in photo else photo["description"],
+                 photo["creatorNickname"],
+                 photo["creationDate"],
+                 photo["modificationDate"],
+                 photoInfo["height"],
+                 photoInfo["width"],
+                 photoInfo["size"],
+                 photoInfo["displayURL"],
+                 variants)
+
+# Which version of each photo to download, from --variant, --max-dimension
+# and --max-bytes. Set up by main()
+variant_policy = "largest"
+max_dimension = None
+max_bytes = None
+
+# Pick the version of a photo to download. "largest" and "smallest" choose
+# from the versions no bigger than max_dimension pixels along their longest
+# side and max_bytes (or the smallest one if none of them are), and "closest"
+# chooses the one nearest to max_dimension (or max_bytes), whichever side of
+# it it's on (the bigger one if two are as near). The photo is returned as it is if there's nothing to choose
+# from or it's already the one wanted
+def choose_variant(photo, policy, max_dimension = None, max_bytes = None):
+    if not photo.variants or \
+       (policy == "largest" and max_dimension is None and max_bytes is None):
+        return photo
+
+    variants = photo.all_variants()
+
+    def area(v):
+        return (v[0] * v[1], v[2])
+
+    if policy == "closest":
+        if max_dimension is not None:
+            best = min(variants,
+                       key = lambda v: (abs(max(v[0], v[1]) - max_dimension),
+                                        -v[0] * v[1], -v[2]))
+        else:
+            best = min(variants, key = lambda v: (abs(v[2] - max_bytes),
+                                                  -v[0] * v[1], -v[2]))
+    else:
+        fits = [ v for v in variants
+                 if (max_dimension is None or max(v[0], v[1]) <= max_dimension)
+                 and (max_bytes is None or v[2] <= max_bytes) ]
+
+        if not fits:
+            best = min(variants, key = area)
+        elif policy == "smallest":
+            best = min(fits, key = area)
+        else:
+            best = max(fits, key = area)
+
+    if best[3] == photo.url:
+        return photo
+
+    return photo.with_variant(best)
+
+# The version of a photo to download according to the command line
+def wanted_variant(photo):
+    return choose_variant(photo, variant_policy, max_dimension, max_bytes)
+
+# Yield all the photos in an album as they arrive. total is the number of
+# photos the album list says it contains, if known. Raises ListingFailed if
+# something goes wrong
+def iter_photo_list_album(groupname, cookiejar, albumid, total = None):
+    for page in iter_yg_pages(api_base + groupname + "/albums/" +
+                              str(albumid) + "?", cookiejar, "total", total,
+                              groupname):
+        # Not sure what photoGroups are but I'll iterate the list anyway
+        for photoGroup in page["photoGroupByDetails"]:
+            for photo in photoGroup["photos"]:
+                yield make_photo_record(photo)
+
+# Get a list of all the photos in an album
+def get_photo_list_album(groupname, cookiejar, albumid, total = None):
+    try:
+        return list(iter_photo_list_album(groupname, cookiejar, albumid, total))
+    except ListingFailed:
+        # An error occurred. I'm too lazy to deal with it properly.
+        # Just bail out with an empty list
+        return []
+
+# Yield all the photos in the group as they arrive. total is the number of
+# photos get_group_stats found, if known. Raises ListingFailed if something
+# goes wrong
+def iter_photo_list_group(groupname, cookiejar, total = None):
+    for page in iter_yg_pages(api_base + groupname + "/photos/?", cookiejar,
+                              "totalPhotos", total, groupname):
+        for photo in page["photos"]:
+            yield make_photo_record(photo)
+
+# Get a list of all the photos in the group
+def get_photo_list_group(groupname, cookiejar, total = None):
+    try:
+        return list(iter_photo_list_group(groupname, cookiejar, total))
+    except ListingFailed:
+        # An error occurred. I'm too lazy to deal with it properly.
+        # Just bail out with an empty list
+        return []
+
+# With --listing albums, an album whose listing fails part of the way through
+# is listed again from the start, up to this many times, once the others are
+# done
+shard_retries = 2
+
+# How far iter_album_shards has got with listing the photos in one album
+class Shard:
+    def __init__(self, groupname, album):
+        self.album = album
+        self.url = api_base + groupname + "/albums/" + str(album.ID) + "?"
+
+        # Always ask for at least one page in case the album list was wrong
+        self.total = max(album.photos, 1)
+
+        # Where the next page to ask for starts, and how many pages have been
+        # asked for but not dealt with yet
+        self.next = 0
+        self.waiting = 0
+
+        self.photos = []
+
+        # What get_yg_data said if a page couldn't be fetched
+        self.failure = None
+
+    # Are there more pages to ask for?
+    def more(self):
+        return self.failure is None and self.next < self.total
+
+    def done(self):
+        return self.waiting == 0 and not self.more()
+
+# List the photos in each of the albums, with up to list_jobs pages being
+# fetched at once across all of them, like iter_yg_pages. Yields each album
+# in turn, once all its pages have arrived, along with its photos and None,
+# or if a page couldn't be fetched, None and the reply from get_yg_data
+def iter_album_shards(groupname, cookiejar, albums):
+    import concurrent.futures
+
+    shards = collections.deque(Shard(groupname, album) for album in albums)
+    pending = collections.deque()
+
+    # For --stats, as in iter_yg_pages
+    pages = 0
+    began = time.perf_counter()
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers = list_jobs) as pool:
+        try:
+            while shards:
+                # Keep list_jobs pages on the go, taking the albums in order.
+                # Only the first few can have had all their pages asked for
+                # without being finished, so this doesn't look far
+                for shard in shards:
+                    if len(pending) >= list_jobs:
+                        break
+
+                    while shard.more() and len(pending) < list_jobs:
+                        pending.append((shard, submit_page(
+                            pool, shard.url + "start=" + str(shard.next) +
+                            "&count=" + str(page_size), cookiejar, groupname)))
+                        shard.next += page_size
+                        shard.waiting += 1
+
+                shard, future = pending.popleft()
+                j = future.result()
+                shard.waiting -= 1
+
+                if shard.failure:
+                    # The album's already failed; the rest of it is no use
+                    pass
+                elif j["result"] != "success":
+                    shard.failure = j
+                else:
+                    pages += 1
+                    page = j["data"]
+                    shard.total = max(shard.total, int(page["total"]))
+
+                    for photoGroup in page["photoGroupByDetails"]:
+                        shard.photos.extend(make_photo_record(photo)
+                                            for photo in photoGroup["photos"])
+
+                while shards and shards[0].done():
+                    shard = shards.popleft()
+
+                    if shard.failure:
+                        yield shard.album, None, shard.failure
+                    else:
+                        yield shard.album, shard.photos, None
+        finally:
+            if stats:
+                stats.listed(pages, time.perf_counter() - began)
+
+# Yield all the photos in the group by listing each album on its own, for
+# --listing albums. Each album's photos are yielded together, once they've
+# all arrived. If a page can't be fetched, only its album is affected: the
+# others carry on, and it's listed again once they're done (up to
+# shard_retries times). Raises ListingFailed if there are still albums that
+# couldn't be listed after that, once all the others have been yielded
+def iter_photo_list_sharded(groupname, cookiejar, albums):
+    for attempt in range(shard_retries + 1):
+        failed = []
+
+        for album, photos, failure in iter_album_shards(groupname, cookiejar,
+                                                        albums):
+            if failure:
+                failed.append(album)
+                problem = failure
+            else:
+                yield from photos
+
+        if not failed:
+            return
+
+        albums = failed
+
+    raise ListingFailed(problem, failed)
+
+# Get a list of all the photos in the group, album by album
+def get_photo_list_sharded(groupname, cookiejar, albums):
+    try:
+        return list(iter_photo_list_sharded(groupname, cookiejar, albums))
+    except ListingFailed:
+        # As with the others, give up altogether if it couldn't all be listed
+        return []
+
+# A local copy of album and photo listings, kept in an SQLite database so that
+# later runs don't have to fetch everything from the server again. Albums and
+# photos are stored as JSON against the group name and their IDs. Each listing
+# we've saved is recorded in the "fetched" table with the time it was fetched:
+# "albums" for the album list, "photos" for the whole group's photos and
+# "album/<ID>" for the photos in one album.
+class ListingCache:
+    def __init__(self, filename, groupname, ttl):
+        import sqlite3
+
+        self.groupname = groupname
+        self.ttl = ttl
+        self.db = sqlite3.connect(filename)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS albums (
+                groupname TEXT, albumID INTEGER, data TEXT,
+                PRIMARY KEY (groupname, albumID));
+            CREATE TABLE IF NOT EXISTS photos (
+                groupname TEXT, photoID INTEGER, albumID INTEGER, data TEXT,
+                PRIMARY KEY (groupname, photoID));
+            CREATE INDEX IF NOT EXISTS photos_album
+                ON photos (groupname, albumID);
+            CREATE TABLE IF NOT EXISTS fetched (
+                groupname TEXT, listing TEXT, time REAL,
+                PRIMARY KEY (groupname, listing));
+            """)
+
+    # The name of the listing that holds the photos for an album, or the whole
+    # group if albumid is None
+    def photo_listing(self, albumid):
+        return "photos" if albumid is None else "album/" + str(albumid)
+
+    # How long ago a listing was saved, or None if it never has been
+    def age(self, listing):
+        row = self.db.execute("SELECT time FROM fetched "
+                              "WHERE groupname = ? AND listing = ?",
+                              (self.groupname, listing)).fetchone()
+
+        return None if row is None else time.time() - row[0]
+
+    def fresh(self, listing):
+        age = self.age(listing)
+        return age is not None and age < self.ttl
+
+    # Do we have photos for an album (or the group), however old? A listing of
+    # the whole group covers every album too
+    def has_photos(self, albumid):
+        return self.age("photos") is not None or \
+               self.age(self.photo_listing(albumid)) is not None
+
+    def fresh_photos(self, albumid):
+        return self.fresh("photos") or self.fresh(self.photo_listing(albumid))
+
+    def mark_fetched(self, listing):
+        self.db.execute("INSERT OR REPLACE INTO fetched VALUES (?, ?, ?)",
+                        (self.groupname, listing, time.time()))
+
+    # Albums and photos are stored as a JSON list of the values they were
+    # created from
+    def encode(self, record):
+        return json.dumps(record.values())
+
+    def get_albums(self):
+        return [ Album(*json.loads(row[0])) for row in
+                 self.db.execute("SELECT data FROM albums WHERE groupname = ? "
+                                 "ORDER BY rowid", (self.groupname,)) ]
+
+    # Save a fresh album list. Albums that have disappeared are dropped along
+    # with their photos. Returns the IDs of albums which are new or have been
+    # modified since the last time the list was saved
+    def put_albums(self, albums):
+        old = { a.ID: a.modificationDate for a in self.get_albums() }
+        changed = { a.ID for a in albums
+                    if a.ID not in old or a.modificationDate != old[a.ID] }
+
+        with self.db:
+            for albumid in old.keys() - { a.ID for a in albums }:
+                self.db.execute("DELETE FROM photos "
+                                "WHERE groupname = ? AND albumID = ?",
+                                (self.groupname, albumid))
+                self.db.execute("DELETE FROM fetched "
+                                "WHERE groupname = ? AND listing = ?",
+                                (self.groupname, self.photo_listing(albumid)))
+
+            self.db.execute("DELETE FROM albums WHERE groupname = ?",
+                            (self.groupname,))
+            self.db.executemany("INSERT INTO albums VALUES (?, ?, ?)",
+                                [ (self.groupname, a.ID, self.encode(a))
+                                  for a in albums ])
+            self.mark_fetched("albums")
+
+        return changed
+
+    def get_photos(self, albumid = None):
+        if albumid is None:
+            rows = self.db.execute("SELECT data FROM photos "
+                                   "WHERE groupname = ? ORDER BY rowid",
+                                   (self.groupname,))
+        else:
+            rows = self.db.execute("SELECT data FROM photos "
+                                   "WHERE groupname = ? AND albumID = ? "
+                                   "ORDER BY rowid",
+                                   (self.groupname, albumid))
+
+        return [ Photo(*json.loads(row[0])) for row in rows ]
+
+    # Save the photos for an album, or the whole group if albumid is None,
+    # replacing whatever was there before
+    def put_photos(self, photos, albumid = None):
+        with self.db:
+            if albumid is None:
+                self.db.execute("DELETE FROM photos WHERE groupname = ?",
+                                (self.groupname,))
+            else:
+                self.db.execute("DELETE FROM photos "
+                                "WHERE groupname = ? AND albumID = ?",
+                                (self.groupname, albumid))
+
+            self.db.executemany("INSERT OR REPLACE INTO photos "
+                                "VALUES (?, ?, ?, ?)",
+                                [ (self.groupname, p.ID, p.albumID,
+                                   self.encode(p)) for p in photos ])
+            self.mark_fetched(self.photo_listing(albumid))
+
+    # Bring the cached photos for the given albums up to date, only fetching
+    # the ones in changed (or that we've never fetched). If albumid is None the
+    # albums make up the whole group. Returns the photo list, or an empty list
+    # if something went wrong
+    def refresh_photos(self, cookiejar, albums, changed, albumid = None):
+        for album in albums:
+            if album.ID in changed or not self.has_photos(album.ID):
+                print("Album " + str(album.ID) + " has changed - "
+                      "fetching its photos...")
+                photos = get_photo_list_album(self.groupname, cookiejar,
+                                              album.ID, album.photos)
+
+                if not photos and album.photos:
+                    return []
+
+                self.put_photos(photos, album.ID)
+
+        if albumid is None:
+            with self.db:
+                self.mark_fetched("photos")
+
+        return self.get_photos(albumid)
+
+# Indexes over the album and photo lists so that albums and photos can be
+# looked up by ID or name without searching the whole list every time. Names
+# are matched ignoring case. Lookups return a list of matches since names (and
+# possibly IDs) aren't guaranteed to be unique
+class Catalog:
+    def __init__(self, albums = (), photos = ()):
+        self.albums_by_id = {}
+        self.albums_by_name = {}
+        self.photos_by_id = {}
+        self.photos_by_name = {}
+        self.dirnames = {}
+
+        self.add_albums(albums)
+        self.add_photos(photos)
+
+    def add_albums(self, albums):
+        for album in albums:
+            self.albums_by_id.setdefault(album.ID, []).append(album)
+            self.albums_by_name.setdefault(album.name.casefold(),
+                                           []).append(album)
+
+    def add_photos(self, photos):
+        for photo in photos:
+            self.photos_by_id.setdefault(photo.ID, []).append(photo)
+            self.photos_by_name.setdefault(photo.name.casefold(),
+                                           []).append(photo)
+
+    def album_with_id(self, albumid):
+        return self.albums_by_id.get(albumid, [])
+
+    def albums_named(self, name):
+        return self.albums_by_name.get(name.casefold(), [])
+
+    def photo_with_id(self, photoid):
+        return self.photos_by_id.get(photoid, [])
+
+    def photos_named(self, name):
+        return self.photos_by_name.get(name.casefold(), [])
+
+    # The name of the directory --download-all puts an album's photos in:
+    # the album ID and name, or just the ID if we don't know about the album
+    def album_dirname(self, albumid):
+        if albumid not in self.dirnames:
+            a = self.album_with_id(albumid)
+
+            if a:
+                self.dirnames[albumid] = str(albumid) + " - " + \
+                                         sanitise_filename(a[0].name)
+            else:
+                self.dirnames[albumid] = str(albumid)
+
+        return self.dirnames[albumid]
+
+def list_photos_long(photos, show_album_id = False):
+    for photo in photos:
+        print("\nPhoto ID:      " + str(photo.ID))
+        if show_album_id:
+            print("Album ID:      " + str(photo.albumID))
+        print("Photo name:    " + photo.name)
+        print("Description:   " + photo.description)
+        print("Created by:    " + photo.creator)
+        print("Creation time: " + str(photo.created))
+        print("Last modified: " + str(photo.modified))
+        print("Height:        " + str(photo.height))
+        print("Width:         " + str(photo.width))
+        print("Filename:      " + photo.filename)
+        print("Filetype:      " + photo.filetype)
+        print("File size:     " + str(photo.filesize))
+
+# Returns the name of the file actually written
+def list_photos_csv(photos, filename):
+    writer = TableWriter(filename, Photo.fields)
+    writer.writerows(p.row() for p in photos)
+    writer.close()
+
+    return writer.filename
+
+def list_photo_ids(photos):
+    print("\nID          Name")
+    print(  "==          ====")
+    for photo in photos:
+        list_photo_id(photo)
+
+def list_photo_id(photo):
+    print("{:<10}  {}".format(photo.ID, photo.name))
+
+# Pass a stream of photos through unchanged, calling func on each one as it
+# goes past
+def tap(photos, func):
+    for photo in photos:
+        func(photo)
+        yield photo
+
+# Pass photos through from one of the iter_... listing functions, giving up in
+# the usual way if the listing fails part of the way through
+def checked_listing(photos):
+    try:
+        yield from photos
+    except ListingFailed as e:
+        print("\nFetching the photo list failed.")
+
+        for album in e.albums:
+            print("Couldn't list album " + str(album.ID) + " (" + album.name +
+                  ").")
+
+        exit(7)
+
+# Downloads are read from the server in pieces of this size
+chunk_size = 64 * 1024
+
+# Keeps all the downloads together to --bandwidth bytes per second. This
+# works like RateLimiter, but counts bytes rather than requests and never
+# changes its rate
+class BandwidthCap:
+    def __init__(self, rate):
+        self.rate = rate
+        self.burst = max(rate / 4, chunk_size)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    # Count n bytes that have just been read, and return how long to wait
+    # before reading any more
+    def reserve(self, n):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens +
+                              (now - self.updated) * self.rate)
+            self.updated = now
+
+            self.tokens -= n
+            return -self.tokens / self.rate if self.tokens < 0 else 0
+
+# Set up by main() if --bandwidth is given
+bandwidth = None
+
+# Decide what to do with the response to a download request. offset is how
+# much is already in the .part file and hashed says whether the digest has
+# seen it yet (it won't have if the .part file was left by an earlier run).
+# Returns one of:
+#   "resume"  - the server sent the rest of the file; append it
+#   "skip"    - we were part of the way through but the server ignored the
+#               Range header; skip what we've got and append the rest
+#   "fresh"   - write the whole file from the start (including when the
+#               server ignored the Range header for an old .part file)
+#   "restart" - the old .part file doesn't make sense to the server; delete
+#               it and ask again
+#   "fail"    - give up and return the status
+def part_action(status, offset, hashed):
+    if status == 206 and offset:
+        return "resume"
+    elif status == 200 and offset and hashed:
+        return "skip"
+    elif status == 200:
+        return "fresh"
+    elif status == 416 and offset and not hashed:
+        return "restart"
+    else:
+        return "fail"
+
+# Feed the contents of a file to a digest
+def hash_file(filename, digest):
+    with open(filename, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+
+# Download an URL to a file. The filename can either be a string or a Path.
+# The data is streamed into "<filename>.part" and only renamed to the real
+# filename once it has all arrived, so a half-finished download never looks
+# like a complete one. With resume set, a leftover .part file from an earlier
+# attempt is continued with a Range request rather than starting again. If
+# the connection drops part of the way through, the download carries on from
+# where it got to (up to the retry limit). If digest is given (e.g. a hashlib
+# object) it's fed the whole file as it's written. Returns 200 on success,
+# 0 if we couldn't talk to the server, otherwise the HTTP status code
+def download(url, cookiejar, filename, extraheaders = None, resume = False,
+             digest = None):
+    timing = stats.start("download", url) if stats else None
+    result = transfer(url, cookiejar, filename, extraheaders, resume, digest,
+                      timing)
+
+    if timing:
+        stats.finish(timing, result)
+
+    return result
+
+# The body of download(), noting bytes and retries in timing if given
+def transfer(url, cookiejar, filename, extraheaders, resume, digest, timing):
+    path = pathlib.Path(filename)
+    partfile = path.with_name(path.name + ".part")
+
+    offset = partfile.stat().st_size if resume and partfile.exists() else 0
+    hashed = not offset
+    attempt = 0
+
+    while True:
+        headers = dict(extraheaders) if extraheaders else {}
+        if offset:
+            headers["Range"] = "bytes=" + str(offset) + "-"
+
+        try:
+            response = fetch(url, cookiejar, headers, stream = True,
+                             timing = timing)
+        except requests.RequestException:
+            return 0
+
+        with response:
+            action = part_action(response.status_code, offset, hashed)
+
+            if action == "restart":
+                partfile.unlink()
+                offset = 0
+                hashed = True
+                continue
+            elif action == "fail":
+                return response.status_code
+            elif action == "resume" and digest and not hashed:
+                hash_file(partfile, digest)
+
+            skip = offset if action == "skip" else 0
+            hashed = True
+
+            try:
+                with open(partfile, "wb" if action == "fresh" else "ab") as f:
+                    for chunk in response.iter_content(chunk_size):
+                        if timing:
+                            timing.bytes += len(chunk)
+
+                        if skip:
+                            n = min(skip, len(chunk))
+                            chunk = chunk[n:]
+                            skip -= n
+
+                        f.write(chunk)
+
+                        if digest:
+                            digest.update(chunk)
+
+                        if bandwidth:
+                            delay = bandwidth.reserve(len(chunk))
+                            if delay:
+                                time.sleep(delay)
+            except (requests.ConnectionError,
+                    requests.exceptions.ChunkedEncodingError) as e:
+                # The connection dropped. Try to pick up where we got to
+                if attempt >= retries:
+                    return 0
+
+                if timing:
+                    timing.retried(type(e).__name__)
+
+                time.sleep(backoff(attempt))
+                attempt += 1
+                offset = partfile.stat().st_size
+                continue
+
+        break
+
+    partfile.replace(path)
+
+    return 200
+
+# A moderately-conservative list of the characters allowed in filenames,
+# as a translation table for ASCII names, which turns everything else into an
+# underscore, and a pattern matching everything else for other names
+filename_chars = string.ascii_letters + string.digits + " !()-_=+,.~"
+filename_table = bytes(c if chr(c) in filename_chars else ord("_")
+                       for c in range(256))
+filename_unwanted = re.compile("[^" + re.escape(filename_chars) + "]")
+
+# Download an URL into memory, for --archive. Works like download(), but
+# returns the result code and the contents (None if it didn't work)
+def download_bytes(url, cookiejar, extraheaders = None, digest = None):
+    timing = stats.start("download", url) if stats else None
+    result, data = transfer_bytes(url, cookiejar, extraheaders, digest,
+                                  timing)
+
+    if timing:
+        stats.finish(timing, result)
+
+    return result, data
+
+# The body of download_bytes(). If the connection drops, the rest is asked
+# for with a Range request, the same way transfer() resumes a .part file
+def transfer_bytes(url, cookiejar, extraheaders, digest, timing):
+    data = bytearray()
+    attempt = 0
+
+    while True:
+        headers = dict(extraheaders) if extraheaders else {}
+        if data:
+            headers["Range"] = "bytes=" + str(len(data)) + "-"
+
+        try:
+            response = fetch(url, cookiejar, headers, stream = True,
+                             timing = timing)
+        except requests.RequestException:
+            return 0, None
+
+        with response:
+            # Everything we've got so far has been through the digest
+            action = part_action(response.status_code, len(data), True)
+
+            if action == "fail":
+                return response.status_code, None
+
+            skip = len(data) if action == "skip" else 0
+
+            try:
+                for chunk in response.iter_content(chunk_size):
+                    if timing:
+                        timing.bytes += len(chunk)
+
+                    if skip:
+                        n = min(skip, len(chunk))
+                        chunk = chunk[n:]
+                        skip -= n
+
+                    data += chunk
+
+                    if digest:
+                        digest.update(chunk)
+
+                    if bandwidth:
+                        delay = bandwidth.reserve(len(chunk))
+                        if delay:
+                            time.sleep(delay)
+            except (requests.ConnectionError,
+                    requests.exceptions.ChunkedEncodingError) as e:
+                if attempt >= retries:
+                    return 0, None
+
+                if timing:
+                    timing.retried(type(e).__name__)
+
+                time.sleep(backoff(attempt))
+                attempt += 1
+                continue
+
+        break
+
+    return 200, bytes(data)
+
+# Replace anything we don't want in a filename with an underscore
+def sanitise_filename(filename):
+    if filename.isascii():
+        return filename.encode().translate(filename_table).decode()
+
+    return filename_unwanted.sub("_", filename)
+
+# Map some common MIME types to Windows file extensions
+exts = { "image/jpeg":  ".jpg",
+         "image/pjpeg": ".jpg",
+         "image/png":   ".png",
+         "image/gif":   ".gif",
+         "image/bmp":   ".bmp" }
+
+# Return a suitable filename for a photo
+def make_photo_filename(photo):
+    # Choose a suitable file extension. If we don't know about the MIME type,
+    # use it as an extension so we can at least save the file
+    fileext = exts[photo.filetype] if photo.filetype in exts \
+                else "." + sanitise_filename(photo.filetype)
+
+    if photo.filename == "n/a":
+        fn = "ID_" + str(photo.ID) + " - " + \
+             sanitise_filename(photo.name) + fileext
+    else:
+        fn = sanitise_filename(photo.filename)
+
+    return fn
+
+def download_photo(photo, cookiejar, filename = None, extraheaders = None,
+                   resume = False):
+    photo = wanted_variant(photo)
+
+    if filename:
+        fn = filename
+    else:
+        fn = make_photo_filename(photo)
+
+    print("\nDownloading as " + fn)
+
+    return download(photo.url + "?download=1", cookiejar, fn, extraheaders,
+                    resume)
+
+# Does the size of a downloaded file match what the listing said? Some photos
+# don't have a size listed, in which case we have to assume it's fine
+def size_ok(photo, size):
+    return not photo.filesize or size == photo.filesize
+
+# Download one photo for --download-all. This may be running in a worker
+# thread, so rather than printing anything it returns the lines it would have
+# printed, along with the result code (None if the download was skipped), the
+# size of the file and its SHA-256 checksum (None if it wasn't downloaded).
+# If force is set, the photo is downloaded even if the file is already there
+def download_all_photo(photo, cookiejar, groupname, destfile, dirname = None,
+                       resume = False, force = False):
+    lines, size, headers = start_photo(photo, groupname, destfile, dirname,
+                                       force)
+
+    if headers is None:
+        return lines, None, size, None
+
+    digest = hashlib.sha256()
+    result = download(photo.url + "?download=1", cookiejar, destfile,
+                      headers, resume, digest)
+
+    return finish_photo(photo, destfile, lines, result, digest)
+
+# The lines --download-all prints about each photo
+def describe_photo(photo, dirname = None):
+    lines = [ "\nPhoto ID:       " + str(photo.ID),
+                "Photo name:     " + photo.name,
+                "Description:    " + photo.description,
+                "Filesize:       " + str(photo.filesize) ]
+
+    if dirname:
+        lines.append("Directory:      " + dirname)
+
+    return lines
+
+# The first half of download_all_photo: describe the photo and check whether
+# we've already got it. Returns the lines to print, the size of the existing
+# file (or None) and the headers to download it with (None to skip it)
+def start_photo(photo, groupname, destfile, dirname = None, force = False):
+    filename = destfile.name
+    lines = describe_photo(photo, dirname)
+    size = destfile.stat().st_size if destfile.exists() else None
+
+    if size is not None and force:
+        lines.append("File '" + filename + "' has changed since it was "
+                     "downloaded.")
+    elif size is not None and size_ok(photo, size):
+        lines.append("File '" + filename + "' already exists - "
+                     "skipping download.")
+        return lines, size, None
+    elif size is not None:
+        lines.append("File '" + filename + "' already exists but is "
+                     "the wrong size.")
+
+    lines.append("Downloading as: " + filename)
+
+    # Pretend to have clicked through from the album page
+    referer = "https://groups.yahoo.com/neo/groups/" + \
+              groupname + "/photos/albums/" + str(photo.albumID)
+
+    return lines, size, { "Referer": referer }
+
+# The second half of download_all_photo: report how the download went. The
+# size of the download is taken from the file unless it's given
+def finish_photo(photo, destfile, lines, result, digest, size = None):
+    checksum = None
+
+    if result != 200:
+        size = None
+    elif size is None:
+        size = destfile.stat().st_size
+
+    if result == 200:
+        checksum = digest.hexdigest()
+        lines.append("Downloaded successfully.")
+
+        if not size_ok(photo, size):
+            lines.append("Warning: expected " + str(photo.filesize) +
+                         " bytes but got " + str(size))
+    else:
+        lines.append("Server returned error " + str(result))
+
+    return lines, result, size, checksum
+
+# How each kind of image we know how to check for --verify starts
+image_signatures = { "image/jpeg":  b"\xff\xd8\xff",
+                     "image/pjpeg": b"\xff\xd8\xff",
+                     "image/png":   b"\x89PNG\r\n\x1a\n",
+                     "image/gif":   b"GIF8",
+                     "image/bmp":   b"BM" }
+
+# Find the height and width of a JPEG file by stepping through its segments
+# to the frame header. Returns None if the segments don't make sense
+def jpeg_dimensions(f):
+    pos = 2
+
+    while True:
+        f.seek(pos)
+        segment = f.read(4)
+
+        if len(segment) < 4 or segment[0] != 0xff:
+            return None
+        elif segment[1] == 0xff:
+            # Padding between segments
+            pos += 1
+            continue
+
+        kind = segment[1]
+        length = int.from_bytes(segment[2:4], "big")
+
+        # SOF0 to SOF15, apart from the other segments numbered among them
+        if 0xc0 <= kind <= 0xcf and kind not in (0xc4, 0xc8, 0xcc):
+            frame = f.read(5)
+            return struct.unpack(">HH", frame[1:]) if len(frame) == 5 \
+                   else None
+        elif kind in (0xd9, 0xda) or length < 2:
+            # The image data (or the end) with no frame header
+            return None
+
+        pos += 2 + length
+
+# What's wrong with an image file, or None if it looks fine, going by the
+# type and dimensions the listing gave (either may be missing), the first
+# piece of the file (head) and the last few bytes (tail). f is the open file,
+# for looking further in
+def image_problem(f, head, tail, filetype, height, width):
+    if not head:
+        return "the file is empty"
+    elif head.lstrip()[:1] == b"<":
+        return "the file is a web page, not an image"
+
+    signature = image_signatures.get(filetype)
+
+    if signature is None:
+        # Not something we know how to look inside
+        return None
+    elif not head.startswith(signature):
+        return "the file isn't of type " + filetype
+
+    if signature == image_signatures["image/jpeg"]:
+        size = jpeg_dimensions(f)
+        complete = tail.rstrip(b"\0").endswith(b"\xff\xd9")
+    elif filetype == "image/png":
+        size = struct.unpack(">II", head[16:24])[::-1] \
+               if len(head) >= 24 else None
+        complete = tail.endswith(b"IEND\xaeB`\x82")
+    elif filetype == "image/gif":
+        size = struct.unpack("<HH", head[6:10])[::-1] \
+               if len(head) >= 10 else None
+        complete = tail.rstrip(b"\0").endswith(b";")
+    else:
+        size = (abs(struct.unpack("<i", head[22:26])[0]),
+                struct.unpack("<i", head[18:22])[0]) \
+               if len(head) >= 26 else None
+        complete = struct.unpack("<I", head[2:6])[0] <= f.seek(0, 2)
+
+    if size is None:
+        return "the image header doesn't make sense"
+    elif not complete:
+        return "the image has been cut short"
+    elif height and width and size not in ((height, width), (width, height)):
+        return "the image is " + str(size[1]) + "x" + str(size[0]) + \
+               " rather than " + str(width) + "x" + str(height)
+
+    return None
+
+# Check a downloaded file for --verify. This runs in a separate process, so
+# it's given the filename and what the listing said about the photo rather
+# than the Photo itself. Returns what's wrong with the file (None if nothing
+# is) and its SHA-256 checksum, which is worked out on the way through
+def check_image(filename, filetype, height, width):
+    digest = hashlib.sha256()
+
+    with open(filename, "rb") as f:
+        head = tail = f.read(chunk_size)
+        digest.update(head)
+
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+            tail = tail[-16:] + chunk
+
+        problem = image_problem(f, head, tail, filetype, height, width)
+
+    return problem, digest.hexdigest()
+
+# Make dst a copy of src without using any more disk space if we can: a hard
+# link, or failing that (say they're on different filesystems) a reflink on
+# filesystems that support them, or failing that an ordinary copy. dst must
+# not already exist
+def link_file(src, dst):
+    try:
+        os.link(src, dst)
+        return
+    except OSError:
+        pass
+
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        try:
+            # FICLONE, on Linux only
+            import fcntl
+            fcntl.ioctl(fdst.fileno(), 0x40049409, fsrc.fileno())
+            return
+        except (ImportError, OSError):
+            pass
+
+        shutil.copyfileobj(fsrc, fdst)
+
+# Replace dst with a link to src
+def replace_with_link(src, dst):
+    tmp = dst.with_name(dst.name + ".link")
+    tmp.unlink(missing_ok = True)
+    link_file(src, tmp)
+    tmp.replace(dst)
+
+# A content-addressed store of photos for --dedup. Each distinct photo is kept
+# once, named after its SHA-256 checksum, and the files in the album
+# directories are links to it. Alongside the store is an index from what the
+# listing tells us about a photo (size, dimensions and filename) to the
+# checksum, so copies of a photo we already have can be linked into place
+# without downloading them at all.
+class DedupStore:
+    def __init__(self, dirname):
+        import sqlite3
+
+        self.root = pathlib.Path(dirname)
+        self.root.mkdir(parents = True, exist_ok = True)
+        self.db = sqlite3.connect(str(self.root / "index.sqlite"))
+        self.db.executescript("""
+            PRAGMA journal_mode = WAL;
+            PRAGMA synchronous = NORMAL;
+            CREATE TABLE IF NOT EXISTS known (
+                filesize INTEGER, height INTEGER, width INTEGER,
+                filename TEXT, checksum TEXT,
+                PRIMARY KEY (filesize, height, width, filename));
+            """)
+
+    def blob(self, checksum):
+        return self.root / checksum[:2] / checksum
+
+    # The checksum of a stored photo which looks the same as this one, if any
+    def lookup(self, photo):
+        # Without a size to go on, we can't be confident they're the same
+        if not photo.filesize or photo.filename == "n/a":
+            return None
+
+        row = self.db.execute("SELECT checksum FROM known WHERE filesize = ? "
+                              "AND height = ? AND width = ? AND filename = ?",
+                              (photo.filesize, photo.height, photo.width,
+                               photo.filename)).fetchone()
+
+        if row and self.blob(row[0]).exists():
+            return row[0]
+
+        return None
+
+    # Put a copy of a stored photo at destfile
+    def materialise(self, checksum, destfile):
+        replace_with_link(self.blob(checksum), destfile)
+
+    # Add a freshly-downloaded photo to the store. If we already had it, the
+    # download is swapped for a link to the stored copy. Returns whether it
+    # was a duplicate
+    def add(self, photo, destfile, checksum):
+        blob = self.blob(checksum)
+        duplicate = blob.exists()
+
+        if duplicate:
+            if not os.path.samefile(blob, destfile):
+                replace_with_link(blob, destfile)
+        else:
+            blob.parent.mkdir(exist_ok = True)
+            # Another --batch group might be storing the same photo
+            tmp = blob.with_name(blob.name + "." +
+                                 str(threading.get_ident()) + ".tmp")
+            tmp.unlink(missing_ok = True)
+            link_file(destfile, tmp)
+            tmp.replace(blob)
+
+        # Only remember what it looks like if it's what the listing promised
+        if photo.filesize and size_ok(photo, destfile.stat().st_size):
+            with self.db:
+                self.db.execute("INSERT OR REPLACE INTO known "
+                                "VALUES (?, ?, ?, ?, ?)",
+                                (photo.filesize, photo.height, photo.width,
+                                 photo.filename, checksum))
+
+        return duplicate
+
+# For --dedup: if the store already has a copy of this photo, link it into
+# place rather than downloading it again. Returns what download_all_photo
+# would have, or None if it needs downloading after all
+def dedup_photo(photo, destfile, dirname, store):
+    if destfile.exists():
+        return None
+
+    checksum = store.lookup(photo)
+
+    if checksum is None:
+        return None
+
+    store.materialise(checksum, destfile)
+
+    lines = describe_photo(photo, dirname)
+    lines.append("Already have a copy of this photo - linked as: " +
+                 destfile.name)
+
+    return lines, None, destfile.stat().st_size, checksum
+
+# Raised when an --archive can't be added to
+class ArchiveError(Exception):
+    pass
+
+# A tar file for --archive, with an SQLite index alongside it (the same name
+# with .index added) giving the photo ID, member name, offset and size of the
+# data, and checksum of each photo in it, so that photos can be found and
+# read without going through the whole archive. The index also has where the
+# last member ends, so that later runs can add to the end without reading
+# the archive, writing over anything an interrupted run left behind. The two
+# zero blocks that end a tar file are written when it's closed. Without its
+# index, where an existing archive ends isn't known, so it isn't added to
+class TarArchive:
+    def __init__(self, path):
+        self.path = path
+
+        # Otherwise the new members would be written over the old ones
+        if (path.exists() and path.stat().st_size and
+            not pathlib.Path(str(path) + ".index").exists()):
+            raise ArchiveError(str(path) + " has no index (" + path.name +
+                               ".index) to show where to add to it")
+
+        self.index = open_archive_index(path)
+
+        row = self.index.execute("SELECT value FROM info "
+                                 "WHERE name = 'end'").fetchone()
+        self.end = row[0] if row else 0
+
+        self.file = open(path, "r+b" if path.exists() else "w+b")
+
+    def add(self, photo, member, data, checksum):
+        info = tarfile.TarInfo(member)
+        info.size = len(data)
+        info.mtime = photo.modificationDate or 0
+        info.mode = 0o644
+        header = info.tobuf(tarfile.PAX_FORMAT)
+
+        self.file.seek(self.end)
+        self.file.write(header)
+        self.file.write(data)
+        self.file.write(bytes(-len(data) % tarfile.BLOCKSIZE))
+
+        offset = self.end + len(header)
+        self.end = self.file.tell()
+
+        # The member has to be on disk before the index says it's there, or
+        # a crash could leave the index pointing past the end of the archive
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        record_member(self.index, photo, member, offset, len(data), checksum,
+                      self.end)
+
+    def close(self):
+        self.file.seek(self.end)
+        self.file.write(bytes(2 * tarfile.BLOCKSIZE))
+        self.file.truncate()
+        self.file.close()
+        self.index.close()
+
+# A zip file for --archive, with an index like TarArchive's. The photos are
+# stored without compression (they're already compressed), so each one can
+# be read straight out of the archive from the offset in the index. The zip
+# file's directory is only written when it's closed, so unlike a tar file,
+# one left by an interrupted run can't be added to
+class ZipArchive:
+    def __init__(self, path):
+        self.path = path
+
+        # zipfile would quietly start a new archive on the end of a broken one
+        if path.exists() and not zipfile.is_zipfile(path):
+            raise ArchiveError(str(path) + " isn't a complete zip file - was "
+                               "the run that made it interrupted?")
+
+        self.zip = zipfile.ZipFile(path, "a", zipfile.ZIP_STORED)
+        self.index = open_archive_index(path)
+
+    def add(self, photo, member, data, checksum):
+        date = time.gmtime(max(photo.modificationDate or 0, 315532800))
+        info = zipfile.ZipInfo(member, date[:6])
+        info.external_attr = 0o644 << 16
+        self.zip.writestr(info, data)
+
+        # The data comes after the member's local header, whose length
+        # depends on its name and extra fields
+        self.zip.fp.seek(info.header_offset + 26)
+        namelen, extralen = struct.unpack("<HH", self.zip.fp.read(4))
+        offset = info.header_offset + 30 + namelen + extralen
+        record_member(self.index, photo, member, offset, len(data), checksum)
+
+    def close(self):
+        self.zip.close()
+        self.index.close()
+
+def open_archive_index(path):
+    import sqlite3
+
+    index = sqlite3.connect(str(path) + ".index", check_same_thread = False)
+    index.executescript("""
+        PRAGMA journal_mode = WAL;
+        PRAGMA synchronous = NORMAL;
+        CREATE TABLE IF NOT EXISTS members (
+            photoID INTEGER PRIMARY KEY, member TEXT, offset INTEGER,
+            size INTEGER, checksum TEXT);
+        CREATE TABLE IF NOT EXISTS info (name TEXT PRIMARY KEY, value);
+        """)
+
+    return index
+
+def record_member(index, photo, member, offset, size, checksum, end = None):
+    with index:
+        index.execute("INSERT OR REPLACE INTO members VALUES (?, ?, ?, ?, ?)",
+                      (photo.ID, member, offset, size, checksum))
+        if end is not None:
+            index.execute("INSERT OR REPLACE INTO info VALUES ('end', ?)",
+                          (end,))
+
+# Where --archive puts the photos instead of separate files. Photos are still
+# planned as files under root (see DownloadPlan), and each one goes into an
+# archive named after the group, as the album directory and filename, or
+# with per_album, into an archive named after the album directory, as the
+# filename. Archives are opened when they're first needed and kept open
+# until close(). Photos are downloaded in parallel, so adding them is
+# serialised
+class ArchiveSink:
+    def __init__(self, root, groupname, fmt, per_album = False):
+        self.root = root
+        self.groupname = groupname
+        self.fmt = fmt
+        self.per_album = per_album
+        self.archives = {}
+        self.lock = threading.Lock()
+
+    # The archive a planned file goes in and its name in there
+    def locate(self, destfile):
+        parts = destfile.relative_to(self.root).parts
+
+        if self.per_album:
+            return self.root / (parts[0] + "." + self.fmt), \
+                   "/".join(parts[1:])
+        else:
+            return self.root / (sanitise_filename(self.groupname) + "." +
+                                self.fmt), "/".join(parts)
+
+    # The archive for a planned file, opening it if need be. Raises
+    # ArchiveError if it can't be added to
+    def archive(self, destfile):
+        path, member = self.locate(destfile)
+
+        with self.lock:
+            if path not in self.archives:
+                self.archives[path] = TarArchive(path) if self.fmt == "tar" \
+                                      else ZipArchive(path)
+
+            return self.archives[path], member
+
+    # The size of the copy of a photo in an archive, or None if there isn't
+    # one
+    def stored(self, archive, photo):
+        with self.lock:
+            row = archive.index.execute("SELECT size FROM members "
+                                        "WHERE photoID = ?",
+                                        (photo.ID,)).fetchone()
+
+        return row[0] if row else None
+
+    def add(self, archive, photo, member, data, checksum):
+        with self.lock:
+            archive.add(photo, member, data, checksum)
+
+    def close(self):
+        for archive in self.archives.values():
+            archive.close()
+
+# Download one photo for --download-all into an archive rather than a file.
+# Returns the same as download_all_photo
+def archive_photo(photo, cookiejar, groupname, destfile, dirname, sink,
+                  force = False):
+    archive, member = sink.archive(destfile)
+    lines = describe_photo(photo, dirname)
+    size = None if force else sink.stored(archive, photo)
+
+    if size is not None and size_ok(photo, size):
+        lines.append("'" + member + "' is already in " + archive.path.name +
+                     " - skipping download.")
+        return lines, None, size, None
+
+    lines.append("Adding to " + archive.path.name + " as: " + member)
+
+    # Pretend to have clicked through from the album page
+    referer = "https://groups.yahoo.com/neo/groups/" + \
+              groupname + "/photos/albums/" + str(photo.albumID)
+
+    digest = hashlib.sha256()
+    result, data = download_bytes(photo.url + "?download=1", cookiejar,
+                                  { "Referer": referer }, digest)
+
+    if result == 200:
+        sink.add(archive, photo, member, data, digest.hexdigest())
+
+    return finish_photo(photo, destfile, lines, result, digest,
+                        len(data) if data is not None else None)
+
+# Copy a photo out of the archives in a directory to filename, going by
+# their indexes. Returns whether it was found
+def extract_photo(dirname, photoid, filename = None):
+    import sqlite3
+
+    for indexfile in sorted(pathlib.Path(dirname).glob("*.index")):
+        archive = indexfile.with_suffix("")
+
+        if archive.suffix not in (".tar", ".zip") or not archive.exists():
+            continue
+
+        index = sqlite3.connect(str(indexfile))
+        row = index.execute("SELECT member, offset, size FROM members "
+                            "WHERE photoID = ?", (photoid,)).fetchone()
+        index.close()
+
+        if row is None:
+            continue
+
+        member, offset, size = row
+        filename = filename or member.rpartition("/")[2]
+
+        with open(archive, "rb") as src, open(filename, "wb") as dst:
+            src.seek(offset)
+            dst.write(src.read(size))
+
+        print("\nExtracted '" + member + "' from " + archive.name + " as " +
+              filename)
+        return True
+
+    return False
+
+# An alternative to the thread pools for --engine async. An asyncio event
+# loop runs in a background thread with a single aiohttp session, so
+# thousands of requests can be in flight from one thread. Coroutines are
+# handed to it with submit(), which returns an ordinary concurrent.futures
+# Future, so the rest of the script can wait for results the same way as with
+# the thread pools. The request side (retries, rate limiting, .part files)
+# works the same as fetch() and download().
+class AsyncEngine:
+    def __init__(self, jobs):
+        self.jobs = jobs
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target = self.loop.run_forever,
+                                       daemon = True)
+        self.thread.start()
+        self.submit(self.start()).result()
+
+    async def start(self):
+        self.semaphore = asyncio.Semaphore(self.jobs)
+
+        # No limit on the whole request, or big photos over a slow link
+        # would never finish, but the same timeouts as fetch() otherwise
+        self.session = aiohttp.ClientSession(
+            connector = aiohttp.TCPConnector(limit = self.jobs),
+            headers = { "User-Agent":
+                        get_session().headers["User-Agent"] },
+            timeout = aiohttp.ClientTimeout(total = None,
+                                            sock_connect = connect_timeout,
+                                            sock_read = read_timeout))
+
+    def submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def close(self):
+        self.submit(self.session.close()).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+    # The cookies for an URL, in the form of a Cookie header
+    def cookie_headers(self, url, cookiejar, headers):
+        headers = dict(headers) if headers else {}
+
+        if cookiejar is not None:
+            import urllib.request
+
+            request = urllib.request.Request(url)
+            cookiejar.add_cookie_header(request)
+            if request.has_header("Cookie"):
+                headers["Cookie"] = request.get_header("Cookie")
+
+        return headers
+
+    # The same as fetch(), but the response must be released when finished
+    async def fetch(self, url, cookiejar, headers = None, timing = None):
+        headers = self.cookie_headers(url, cookiejar, headers)
+        attempt = 0
+
+        while True:
+            await asyncio.sleep(limiter.reserve())
+
+            try:
+                response = await self.session.get(url, headers = headers)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                if attempt >= retries:
+                    raise
+
+                if timing:
+                    timing.retried(type(e).__name__)
+
+                await asyncio.sleep(backoff(attempt))
+                attempt += 1
+                continue
+
+            if response.status not in retry_statuses:
+                limiter.succeeded()
+                return response
+
+            delay = retry_after(response.headers)
+
+            if response.status == 429 or delay is not None:
+                limiter.throttled()
+
+            if attempt >= retries:
+                return response
+
+            if timing:
+                timing.retried(response.status)
+
+            response.release()
+            await asyncio.sleep(backoff(attempt) if delay is None else delay)
+            attempt += 1
+
+    async def get_yg_data(self, url, cookiejar):
+        timing = stats.start("api", url) if stats else None
+        cached = http_cache.get(url) if http_cache else None
+
+        async with self.semaphore:
+            try:
+                response = await self.fetch(
+                               url, cookiejar,
+                               http_cache.validators(cached) if cached
+                               else None, timing = timing)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if timing:
+                    stats.finish(timing, 0)
+
+                return { "result": "error",
+                         "status": 0,
+                         "message": str(e) }
+
+            try:
+                body = await response.read()
+            finally:
+                response.release()
+
+        if timing:
+            timing.bytes = len(body)
+            stats.finish(timing, response.status)
+
+        if cached and response.status == 304:
+            return yg_result(200, "OK", cached[2],
+                             lambda: json.loads(cached[3]))
+
+        if http_cache and response.status == 200 and \
+           response.content_type == "application/json":
+            http_cache.put(url, response.headers, response.content_type, body)
+
+        return yg_result(response.status, response.reason,
+                         response.content_type, lambda: json.loads(body))
+
+    async def download(self, url, cookiejar, filename, extraheaders = None,
+                       resume = False, digest = None):
+        timing = stats.start("download", url) if stats else None
+        result = await self.transfer(url, cookiejar, filename, extraheaders,
+                                     resume, digest, timing)
+
+        if timing:
+            stats.finish(timing, result)
+
+        return result
+
+    async def transfer(self, url, cookiejar, filename, extraheaders, resume,
+                       digest, timing):
+        path = pathlib.Path(filename)
+        partfile = path.with_name(path.name + ".part")
+
+        offset = partfile.stat().st_size if resume and partfile.exists() else 0
+        hashed = not offset
+        attempt = 0
+
+        while True:
+            headers = dict(extraheaders) if extraheaders else {}
+            if offset:
+                headers["Range"] = "bytes=" + str(offset) + "-"
+
+            try:
+                response = await self.fetch(url, cookiejar, headers, timing)
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                return 0
+
+            try:
+                action = part_action(response.status, offset, hashed)
+
+                if action == "restart":
+                    partfile.unlink()
+                    offset = 0
+                    hashed = True
+                    continue
+                elif action == "fail":
+                    return response.status
+                elif action == "resume" and digest and not hashed:
+                    hash_file(partfile, digest)
+
+                skip = offset if action == "skip" else 0
+                hashed = True
+
+                try:
+                    with open(partfile,
+                              "wb" if action == "fresh" else "ab") as f:
+                        async for chunk in \
+                                response.content.iter_chunked(chunk_size):
+                            if timing:
+                                timing.bytes += len(chunk)
+
+                            if skip:
+                                n = min(skip, len(chunk))
+                                chunk = chunk[n:]
+                                skip -= n
+
+                            f.write(chunk)
+
+                            if digest:
+                                digest.update(chunk)
+
+                            if bandwidth:
+                                delay = bandwidth.reserve(len(chunk))
+                                if delay:
+                                    await asyncio.sleep(delay)
+                except (aiohttp.ClientPayloadError,
+                        aiohttp.ClientConnectionError,
+                        asyncio.TimeoutError) as e:
+                    # The connection dropped or stalled. Try to pick up where
+                    # we got to
+                    if attempt >= retries:
+                        return 0
+
+                    if timing:
+                        timing.retried(type(e).__name__)
+
+                    await asyncio.sleep(backoff(attempt))
+                    attempt += 1
+                    offset = partfile.stat().st_size
+                    continue
+            finally:
+                response.release()
+
+            break
+
+        partfile.replace(path)
+
+        return 200
+
+    async def download_all_photo(self, photo, cookiejar, groupname, destfile,
+                                 dirname = None, resume = False,
+                                 force = False):
+        lines, size, headers = start_photo(photo, groupname, destfile, dirname,
+                                           force)
+
+        if headers is None:
+            return lines, None, size, None
+
+        digest = hashlib.sha256()
+
+        async with self.semaphore:
+            result = await self.download(photo.url + "?download=1", cookiejar,
+                                         destfile, headers, resume, digest)
+
+        return finish_photo(photo, destfile, lines, result, digest)
+
+# Set up by main() if --engine async is chosen
+engine = None
+
+# Set up by main() if --verify is given: a pool of processes for check_image
+verifier = None
+
+# No more than this many files are waiting for --verify to check them at once
+verify_limit = 256
+
+# The --log-csv file is written out at least this often (in seconds), so it
+# shows how things are going during a long run
+log_flush_interval = 5
+
+# When --download-all knows how much there is to download, it reports how
+# it's getting on this often (in seconds)
+progress_interval = 10
+
+# The columns of the --log-csv file
+log_fields = [ "ID", "albumID", "name", "yahoo_filename", "filetype",
+               "description", "creator", "created", "modified", "height",
+               "width", "filesize", "result", "saved_filename" ]
+
+# Works out where --download-all saves each photo: the directory for its
+# album under root (or the album given, for one album on its own) and the
+# filename from make_photo_filename. Each directory is made the first time a
+# photo is placed in it. Two photos that would have the same filename in a
+# directory are told apart by adding the photo ID to the name of the later
+# one in the listing, so the plan comes out the same however often it's made
+# for the same listing. Photos that end up being skipped still need to be
+# placed so that their filenames stay taken. With make_dirs unset nothing is
+# made, for when the photos are going into an --archive
+class DownloadPlan:
+    def __init__(self, root, catalog, album = None, make_dirs = True):
+        self.root = root
+        self.catalog = catalog
+        self.album = album
+        self.make_dirs = make_dirs
+        self.dirs = {}
+
+    # The file to save the photo as and the directory name to show (or None)
+    def place(self, photo):
+        albumid = self.album.ID if self.album else photo.albumID
+        entry = self.dirs.get(albumid)
+
+        if entry is None:
+            dirname = self.catalog.album_dirname(albumid)
+            destdir = self.root / dirname
+            if self.make_dirs:
+                destdir.mkdir(exist_ok = True)
+
+            # The filenames used so far, casefolded in case the filesystem
+            # doesn't care about case, and the photos using them
+            entry = self.dirs[albumid] = (destdir,
+                                          None if self.album else dirname, {})
+
+        destdir, dirname, names = entry
+        filename = make_photo_filename(photo)
+
+        if names.setdefault(filename.casefold(), photo.ID) != photo.ID:
+            stem, dot, ext = filename.rpartition(".")
+            suffix = " (ID_" + str(photo.ID) + ")"
+            filename = stem + suffix + dot + ext if dot else filename + suffix
+            names.setdefault(filename.casefold(), photo.ID)
+
+        return destdir / filename, dirname
+
+# For --check-space and --order: add up how much there is to download in
+# each directory from a list of places (as passed to download_all), leaving
+# out files that are already there unless they're in changed, and print it.
+# Returns the total number of bytes
+def estimate_download(places, changed = ()):
+    counts = collections.Counter()
+    sizes = collections.Counter()
+
+    for photo, destfile, dirname in places:
+        counts[destfile.parent.name] += 1
+
+        try:
+            existing = destfile.stat().st_size
+        except FileNotFoundError:
+            existing = None
+
+        if existing is None or not size_ok(photo, existing) or \
+           photo.ID in changed:
+            sizes[destfile.parent.name] += photo.filesize or 0
+
+    print("\n{:<50} {:>8} {:>12}".format("Directory", "Photos",
+                                          "MB to fetch"))
+    for name in counts:
+        print("{:<50.50} {:>8} {:>12.1f}".format(name, counts[name],
+                                                 sizes[name] / 1e6))
+    print("{:<50} {:>8} {:>12.1f}".format("Total", sum(counts.values()),
+                                          sum(sizes.values()) / 1e6))
+
+    return sum(sizes.values())
+
+# The heart of --download-all. places yields each photo along with the file
+# to save it as and the directory name to show (or None). Each photo is handed
+# to submit (or the async engine, if we're using it) to be downloaded, and
+# the results are dealt with in the order the photos went in, with no more
+# than 2 * jobs queued up at once so we don't hold the whole lot in memory.
+# How each one went is printed (unless quiet) and passed on to the journal,
+# the dedup store and the CSV log writer if they're given. Photos whose IDs
+# are in changed are downloaded again even if the file is already there. If
+# the number of bytes there are to download is given as expected, progress
+# and an estimate of the time left are printed every so often (unless quiet).
+# previews maps the IDs of photos that are only previews to the full photos,
+# which are what the journal records for them. If sink is given, the photos go into archives there instead
+# of files (which needs threads rather than the async engine), and
+# ArchiveError is raised if one can't be added to. With --verify, each file
+# that's downloaded or already there is handed to the verifier to check while
+# the downloads carry on, and one that doesn't look right is downloaded again
+# (once). Returns a Counter of how many photos were downloaded (counting ones
+# downloaded again), failed, already there or linked from the store, and the
+# bytes downloaded, plus with --verify how many were verified, downloaded
+# again and still didn't look right the second time ("corrupt")
+def download_all(places, groupname, cookiejar, jobs, submit, resume = False,
+                 journal = None, store = None, logger = None, quiet = False,
+                 changed = (), expected = None, previews = {}, sink = None):
+    import concurrent.futures
+
+    tally = collections.Counter()
+    pending = collections.deque()
+    began = reported = time.monotonic()
+
+    # Files being checked by the verifier, and photos that didn't pass and
+    # are waiting to be downloaded again. Each photo is only sent back once
+    checking = collections.deque()
+    redo = collections.deque()
+    redone = set()
+
+    # How much of expected has been dealt with one way or another
+    accounted = 0
+
+    def report_progress():
+        nonlocal reported
+
+        now = time.monotonic()
+        if now - reported < progress_interval:
+            return
+
+        reported = now
+        rate = tally["bytes"] / (now - began)
+        left = max(0, expected - accounted)
+
+        print("\nProgress: " + "{:.1f} of {:.1f} MB ({:.0%}), ".format(
+                  accounted / 1e6, expected / 1e6,
+                  accounted / expected if expected else 1) +
+              "{:.2f} MB/s".format(rate / 1e6) +
+              (", about " + str(timedelta(seconds = round(left / rate))) +
+               " to go" if rate else ""))
+
+    def finish_oldest():
+        nonlocal accounted
+
+        photo, destfile, dirname, future, linked = pending.popleft()
+        lines, result, size, checksum = future.result()
+
+        if store and result == 200 and store.add(photo, destfile, checksum):
+            lines.append("Same as a photo already downloaded - linked to "
+                         "the stored copy.")
+            tally["duplicates"] += 1
+
+        if not quiet:
+            print("\n".join(lines))
+
+        if linked:
+            tally["linked"] += 1
+        elif result is None:
+            tally["existing"] += 1
+        elif result == 200:
+            tally["downloaded"] += 1
+            tally["bytes"] += size
+        else:
+            tally["failed"] += 1
+
+        # Files that were already there weren't expected to be downloaded
+        if expected is not None and (linked or result is not None):
+            accounted += photo.filesize or 0
+
+            if not quiet:
+                report_progress()
+
+        if journal:
+            journal.finished(photo, destfile, result, size, checksum,
+                             previews.get(photo.ID))
+
+        if logger and result is not None:
+            # Everything about the photo except the URL, then the outcome
+            logger.writerow(photo.row()[:-1] + [ result, str(destfile) ])
+
+        if verifier and not linked and result in (None, 200):
+            future = verifier.submit(check_image, str(destfile),
+                                     photo.filetype, photo.height, photo.width)
+            checking.append((photo, destfile, dirname, future, checksum, size))
+
+        # Deal with the checks that have finished, or wait for one if too
+        # many are piling up
+        while checking and (checking[0][3].done() or
+                            len(checking) >= verify_limit):
+            finish_check()
+
+    def finish_check():
+        photo, destfile, dirname, future, checksum, size = checking.popleft()
+        problem, verified = future.result()
+
+        if problem is None and checksum and verified != checksum:
+            problem = "the file doesn't match what was downloaded"
+
+        if problem is None:
+            tally["verified"] += 1
+            return
+
+        if photo.ID in redone:
+            tally["corrupt"] += 1
+            message = "\nPhoto ID " + str(photo.ID) + " still doesn't look " \
+                      "right after downloading it again: " + problem + "."
+        else:
+            # Out of the way, so it's downloaded afresh
+            destfile.unlink(missing_ok = True)
+            redone.add(photo.ID)
+            redo.append((photo, destfile, dirname))
+            tally["redone"] += 1
+            message = "\nPhoto ID " + str(photo.ID) + " doesn't look right (" + \
+                      problem + ") - downloading it again."
+
+        if not quiet:
+            print(message)
+
+        if journal:
+            full = previews.get(photo.ID)
+            journal.update(full or photo, destfile,
+                           "preview" if full else "failed", "verify", size,
+                           verified)
+
+    def start(photo, destfile, dirname, force):
+        if journal:
+            journal.started(photo, destfile, previews.get(photo.ID))
+
+        known = dedup_photo(photo, destfile, dirname, store) if store else None
+
+        if known:
+            # Nothing to wait for, but it still needs to go through the queue
+            # to be reported in order
+            future = concurrent.futures.Future()
+            future.set_result(known)
+        elif sink:
+            future = submit(archive_photo, photo, cookiejar, groupname,
+                            destfile, dirname, sink, force)
+        elif engine:
+            future = engine.submit(engine.download_all_photo(
+                         photo, cookiejar, groupname, destfile, dirname,
+                         resume and not force, force))
+        else:
+            future = submit(download_all_photo, photo, cookiejar, groupname,
+                            destfile, dirname, resume and not force, force)
+
+        pending.append((photo, destfile, dirname, future, bool(known)))
+
+        if len(pending) >= 2 * jobs:
+            finish_oldest()
+
+    for photo, destfile, dirname in places:
+        # A partly-downloaded old version is no use for a changed photo
+        start(photo, destfile, dirname, photo.ID in changed)
+
+        while redo:
+            start(*redo.popleft(), False)
+
+    while pending or checking or redo:
+        if redo:
+            start(*redo.popleft(), False)
+        elif pending:
+            finish_oldest()
+        else:
+            finish_check()
+
+    return tally
+
+# A record of how --download-all is getting on, kept in an SQLite database so
+# that an interrupted run can pick up where it left off. Each photo is stored
+# against the group name and photo ID with its state:
+#   in-flight - handed over to be downloaded but not finished. Since photos
+#               are handed over as soon as they're listed, this is also what
+#               pending photos look like after a run is killed
+#   done      - saved and the size matches the listing
+#   preview   - --preview is fetching or has fetched a small version, which
+#               still needs to be replaced by the one we really want. The
+#               photo kept is that one, and status says how the small
+#               version went ("in-flight" until it's finished). Retrying
+#               always downloads it afresh, as what's there (or in a .part
+#               file) is the small version
+#   failed    - the server returned an error (status holds the HTTP status),
+#               the size was wrong (status is "size") or --verify didn't
+#               like the file (status is "verify")
+# along with where it's being saved and the photo itself, so that failures
+# (and previews) can be retried without listing the group again.
+class DownloadJournal:
+    def __init__(self, filename, groupname):
+        import sqlite3
+
+        self.groupname = groupname
+        self.db = sqlite3.connect(filename)
+        self.db.executescript("""
+            PRAGMA journal_mode = WAL;
+            PRAGMA synchronous = NORMAL;
+            CREATE TABLE IF NOT EXISTS downloads (
+                groupname TEXT, photoID INTEGER, state TEXT, status TEXT,
+                size INTEGER, checksum TEXT, destfile TEXT, photo TEXT,
+                time REAL, PRIMARY KEY (groupname, photoID));
+            """)
+
+    # The IDs of all the photos that have been downloaded
+    def done_photos(self):
+        return { row[0] for row in
+                 self.db.execute("SELECT photoID FROM downloads "
+                                 "WHERE groupname = ? AND state = 'done'",
+                                 (self.groupname,)) }
+
+    # For --sync: what we know about each photo that's been downloaded, as a
+    # dict from photo ID to its modification date, size and album ID as they
+    # were listed then, and where it was saved
+    def manifest(self):
+        return { row[0]: row[1:] for row in
+                 self.db.execute("SELECT photoID, json_extract(photo, '$[8]'), "
+                                 "json_extract(photo, '$[11]'), "
+                                 "json_extract(photo, '$[1]'), destfile "
+                                 "FROM downloads "
+                                 "WHERE groupname = ? AND state = 'done'",
+                                 (self.groupname,)) }
+
+    # The photos that failed or didn't finish, with where they were going and
+    # their state
+    def unfinished(self):
+        return [ (Photo(*json.loads(row[0])), pathlib.Path(row[1]), row[2])
+                 for row in
+                 self.db.execute("SELECT photo, destfile, state FROM downloads "
+                                 "WHERE groupname = ? AND state != 'done' "
+                                 "ORDER BY rowid", (self.groupname,)) ]
+
+    def update(self, photo, destfile, state, status = None, size = None,
+               checksum = None):
+        with self.db:
+            self.db.execute("INSERT OR REPLACE INTO downloads "
+                            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                            (self.groupname, photo.ID, state,
+                             None if status is None else str(status), size,
+                             checksum, str(destfile),
+                             json.dumps(photo.values()), time.time()))
+
+    # If the photo is only a preview, full is the photo it stands in for,
+    # which is what's recorded (see above)
+    def started(self, photo, destfile, full = None):
+        if full:
+            self.update(full, destfile, "preview", "in-flight")
+        else:
+            self.update(photo, destfile, "in-flight")
+
+    # Record how a download went, using what download_all_photo returned.
+    # full is as for started()
+    def finished(self, photo, destfile, result, size, checksum, full = None):
+        if result not in (None, 200):
+            state, status = "failed", result
+        elif not size_ok(photo, size):
+            state, status = "failed", "size"
+        else:
+            state, status = "done", result
+
+        if full:
+            self.update(full, destfile, "preview", status, size, checksum)
+        else:
+            self.update(photo, destfile, state, status, size, checksum)
+
+# For --sync: compare a photo from the listing with what the journal's
+# manifest says it was when we downloaded it, returning "new", "changed" or
+# "same". The photo is taken out of the manifest, so once the whole group has
+# been listed, what's left is the photos that have gone from it
+def sync_state(photo, manifest):
+    known = manifest.pop(photo.ID, None)
+
+    if known is None:
+        return "new"
+    elif (photo.modificationDate, photo.filesize) != tuple(known[:2]):
+        return "changed"
+    else:
+        return "same"
+
+# Check that we can get into the group and report how big it is. Exits with
+# an explanation if anything is wrong
+def connect_to_group(groupname, cookiejar):
+    print("\nTesting access to group '" + groupname + "'...")
+    stats = get_group_stats(groupname, cookiejar)
+
+    if stats["result"] == "no-access":
+        print("No access to group - have you logged in?")
+        exit(1)
+
+    if stats["result"] == "error":
+        print("Server returned error code " + str(stats["status"]) +
+            " and error message '" + stats["message"] + "'")
+        if stats["status"] == 404 and \
+           stats["message"] == \
+                "ResourceNotFoundException{resourceType=GROUP Group...":
+            print("Yahoo! could not find the group - please double-check")
+            print("the name you specified.")
+        else:
+            print("This may indicate a problem on Yahoo!'s servers.")
+
+        exit(2)
+
+    if stats["result"] == "no-data":
+        print("The server returned no data.")
+        print("This may indicate a problem on Yahoo!'s servers.")
+
+        exit(3)
+
+    print("\nSuccessfully connected to the group. The server reports:")
+    print("Number of albums: " + str(stats["albums"]))
+    print("Number of photos: " + str(stats["photos"]))
+    print("These numbers may be inaccurate.")
+
+    return stats
+
+# What went wrong, in a few words, from a get_group_stats result that wasn't
+# a success
+def group_problem(result):
+    if result["result"] == "no-access":
+        return "No access to group"
+    elif result["result"] == "error":
+        return "Server returned error " + str(result["status"]) + " (" + \
+               result["message"] + ")"
+    else:
+        return "The server returned no data"
+
+# Archive one group for --batch. This does what --download-all does, into a
+# directory named after the group, with the work going through the shared
+# scheduler. Nothing is printed for each photo. Returns a Counter of how the
+# photos went (see download_all, plus "skipped" for ones the journal says
+# we've got, or with --sync that haven't changed since), what went wrong if
+# anything (or None) and how long it took
+def archive_group(groupname, cookiejar, args):
+    began = time.perf_counter()
+    tally = collections.Counter()
+    problem = None
+
+    info = get_group_stats(groupname, cookiejar)
+
+    if info["result"] != "success":
+        return tally, group_problem(info), time.perf_counter() - began
+
+    albums = get_album_list(groupname, cookiejar, info["albums"])
+
+    if not albums and info["albums"]:
+        return tally, "Fetching the album list failed", \
+               time.perf_counter() - began
+
+    catalog = Catalog(albums)
+    groupdir = pathlib.Path.cwd() / sanitise_filename(groupname)
+    groupdir.mkdir(exist_ok = True)
+    plan = DownloadPlan(groupdir, catalog, make_dirs = not args.archive)
+    sink = ArchiveSink(groupdir, groupname, args.archive,
+                       args.archive_per_album) if args.archive else None
+
+    # Each group's thread needs its own database connections
+    journal = DownloadJournal(args.journal, groupname) if args.journal \
+              else None
+    done = journal.done_photos() if journal and not args.sync else set()
+    manifest = journal.manifest() if args.sync else {}
+    changed = set()
+    store = DedupStore(args.dedup) if args.dedup else None
+
+    logger = None
+    if args.log_csv:
+        logger = TableWriter(groupdir / args.log_csv, log_fields,
+                             log_flush_interval)
+
+    def places():
+        nonlocal problem
+
+        if args.listing == "albums":
+            photos = iter_photo_list_sharded(groupname, cookiejar, albums)
+        else:
+            photos = iter_photo_list_group(groupname, cookiejar,
+                                           info["photos"])
+
+        try:
+            for photo in photos:
+                photo = wanted_variant(photo)
+                state = sync_state(photo, manifest) if args.sync else None
+                destfile, dirname = plan.place(photo)
+
+                if photo.ID in done or state == "same":
+                    tally["skipped"] += 1
+                    continue
+                elif state == "changed":
+                    changed.add(photo.ID)
+
+                yield photo, destfile, dirname
+        except ListingFailed as e:
+            # Finish off what we've started, then report it
+            problem = "Fetching the photo list failed" + \
+                      (" for " + str(len(e.albums)) + " albums"
+                       if e.albums else "")
+
+    def submit(fn, *fnargs):
+        return scheduler.submit((groupname, "download"), fn, *fnargs)
+
+    try:
+        tally += download_all(places(), groupname, cookiejar, args.jobs,
+                              submit, args.resume, journal, store, logger,
+                              quiet = True, changed = changed, sink = sink)
+    finally:
+        if sink:
+            sink.close()
+
+        if logger:
+            logger.close()
+
+    return tally, problem, time.perf_counter() - began
+
+# The columns of the --batch summary, and what goes in them
+batch_columns = [ ("Downloaded", "downloaded"), ("Failed", "failed"),
+                  ("Existing", "existing"), ("Linked", "linked"),
+                  ("Skipped", "skipped") ]
+
+def batch_row(name, tally, elapsed):
+    return "{:<20} ".format(name) + \
+           "".join("{:>11}".format(tally[key]) for _, key in batch_columns) + \
+           "{:>11.1f}{:>9.1f}".format(tally["bytes"] / 1e6, elapsed)
+
+# Archive every group named in the --batch file (one per line, ignoring blank
+# lines and ones starting with #), several groups at a time, and sum up how
+# it went. Returns whether everything went smoothly
+def run_batch(args, cookiejar):
+    global scheduler
+
+    import concurrent.futures
+
+    with open(args.batch) as f:
+        groups = [ line.strip() for line in f
+                   if line.strip() and not line.startswith("#") ]
+
+    groups = list(dict.fromkeys(groups))
+    scheduler = FairScheduler(args.jobs)
+    began = time.perf_counter()
+    results = {}
+
+    print("\nArchiving " + str(len(groups)) + " groups, up to " +
+          str(args.batch_groups) + " at a time...")
+
+    with concurrent.futures.ThreadPoolExecutor(
+             max_workers = args.batch_groups) as drivers:
+        futures = { drivers.submit(archive_group, groupname, cookiejar,
+                                   args): groupname for groupname in groups }
+
+        for future in concurrent.futures.as_completed(futures):
+            groupname = futures[future]
+
+            try:
+                tally, problem, elapsed = future.result()
+            except Exception as e:
+                # Don't let one odd group stop all the others
+                tally, problem, elapsed = collections.Counter(), repr(e), 0
+
+            results[groupname] = (tally, problem, elapsed)
+
+            print("\n" + groupname + ": " + str(tally["downloaded"]) +
+                  " downloaded, " + str(tally["failed"]) + " failed, " +
+                  str(tally["existing"] + tally["linked"] +
+                      tally["skipped"]) + " already there, " +
+                  "{:.1f} MB in {:.1f}s".format(tally["bytes"] / 1e6,
+                                                 elapsed) +
+                  (", " + str(tally["corrupt"]) + " still corrupt after "
+                   "downloading again" if tally["corrupt"] else "") +
+                  (" - " + problem if problem else ""))
+
+    total = collections.Counter()
+
+    print("\nBatch summary:")
+    print("{:<20} ".format("Group") +
+          "".join("{:>11}".format(title) for title, _ in batch_columns) +
+          "{:>11}{:>9}".format("MB", "Seconds"))
+
+    for groupname in groups:
+        tally, problem, elapsed = results[groupname]
+        total += tally
+        print(batch_row(groupname, tally, elapsed))
+
+        if problem:
+            print("    " + problem)
+
+    print(batch_row("Total", total, time.perf_counter() - began))
+
+    return not any(problem or tally["failed"] or tally["corrupt"]
+                   for tally, problem, _ in results.values())
+
+def main():
+    parser = argparse.ArgumentParser(
+        description = "Yahoo! Groups bulk photo downloader",
+        epilog = "You should ensure that you are logged into Yahoo in either "
+                 "Chrome/Chromium or Firefox and specify the appropriate "
+                 "browser option to import the login details.")
+
+    parser.add_argument("groupname", help = "The name of the group",
+                        nargs = "?")
+
+    parser.add_argument("--batch",
+                        help = "Archive every group named in FILENAME (one "
+                               "per line) as --download-all would, each into "
+                               "a directory named after the group, sharing "
+                               "the --jobs threads between them",
+                        metavar = "FILENAME")
+
+    parser.add_argument("--batch-groups",
+                        help = "How many groups --batch works on at once "
+                               "(default 4)",
+                        type = int, default = 4, metavar = "N")
+
+    bselect = parser.add_mutually_exclusive_group(required = True)
+
+    bselect.add_argument("--chrome",
+                        help = "Use login cookies from Chrome/Chromium",
+                        action = "store_true")
+
+    bselect.add_argument("--firefox",
+                        help = "Use login cookies from Firefox",
+                        action = "store_true")
+
+    bselect.add_argument("--no-cookies",
+                        help = "Don't load any login cookies (only useful with "
+                               "--api-base)",
+                        action = "store_true")
+
+    parser.add_argument("--cookie-cache",
+                        help = "Save the Yahoo cookies taken from the browser "
+                               "in FILENAME (unencrypted, readable only by "
+                               "you) so later runs can skip reading the "
+                               "browser's cookie database. They're used until "
+                               "one expires or for a day at most; delete the "
+                               "file after logging in again",
+                        metavar = "FILENAME")
+
+    parser.add_argument("--api-base",
+                        help = "Use a different API server, e.g. a local "
+                               "stand-in for testing",
+                        metavar = "URL")
+
+    parser.add_argument("--list-albums", "-l",
+                        help = "List available albums",
+                        action = "store_true")
+
+    parser.add_argument("--list-albums-csv", "-c",
+                        help = "List available albums to a CSV file (or "
+                               "JSON Lines or Parquet if FILENAME ends in "
+                               ".jsonl or .parquet)",
+                        metavar = "FILENAME")
+
+    parser.add_argument("--list-album-ids", "-L",
+                        help = "List available albums with just names, "
+                               "photo counts and IDs",
+                        action = "store_true")
+
+    aselect = parser.add_mutually_exclusive_group()
+
+    aselect.add_argument("--album", "-a",
+                         help = "Select an album by name")
+
+    aselect.add_argument("--album-id", "-A",
+                         help = "Select an album by ID number",
+                         type = int)
+
+    parser.add_argument("--list-photos", "-p",
+                        help = "List photos in the group or the selected album",
+                        action = "store_true")
+
+    parser.add_argument("--list-photos-csv", "-C",
+                        help = "List photos in the group or the selected album "
+                               "to a CSV file (or JSON Lines or Parquet if "
+                               "FILENAME ends in .jsonl or .parquet)",
+                        metavar = "FILENAME")
+
+    parser.add_argument("--list-photo-ids", "-P",
+                        help = "List photos in the group or the selected album "
+                               "with just names and IDs",
+                        action = "store_true")
+
+    pselect = parser.add_mutually_exclusive_group()
+
+    pselect.add_argument("--download-photo", "-d",
+                         help = "Download a photo by name")
+
+    pselect.add_argument("--download-photo-id", "-D",
+                         help = "Download a photo by ID number",
+                         type = int)
+
+    pselect.add_argument("--download-all", "-g",
+                         help = "Download all photos in the selected album or "
+                                "the whole group into folder(s) named with the "
+                                "album ID and album name",
+                         action = "store_true")
+
+    pselect.add_argument("--sync",
+                         help = "Like --download-all, but only download the "
+                                "photos that are new or have changed (going "
+                                "by their modification date and size) since "
+                                "the --journal says they were downloaded",
+                         action = "store_true")
+
+    pselect.add_argument("--retry-failed",
+                         help = "Retry the downloads that the --journal says "
+                                "failed or didn't finish, without listing the "
+                                "group again",
+                         action = "store_true")
+
+    parser.add_argument("--filename", "-f",
+                        help = "Specify a filename when downloading a single "
+                               "photo")
+
+    parser.add_argument("--log-csv", "-G",
+                        help = "Log results of --download-all to a CSV file "
+                               "(or JSON Lines or Parquet if FILENAME ends in "
+                               ".jsonl or .parquet)",
+                        metavar = "FILENAME")
+
+    parser.add_argument("--resume", "-r",
+                        help = "Continue partial downloads (.part files) left "
+                               "behind by an earlier run",
+                        action = "store_true")
+
+    parser.add_argument("--jobs", "-j",
+                        help = "Number of photos to download at the same time "
+                               "with --download-all (default 1)",
+                        type = int,
+                        default = 1,
+                        metavar = "N")
+
+    parser.add_argument("--list-jobs",
+                        help = "Number of listing pages to fetch at the same "
+                               "time (default 4)",
+                        type = int,
+                        default = 4,
+                        metavar = "N")
+
+    parser.add_argument("--page-size",
+                        help = "Number of albums or photos to ask for in each "
+                               "listing request (default 100)",
+                        type = int,
+                        default = 100,
+                        metavar = "N")
+
+    parser.add_argument("--listing",
+                        help = "How to list all the photos in the group: in "
+                               "one go (the default), or album by album, so "
+                               "that if part of the listing fails only that "
+                               "album has to be listed again",
+                        choices = [ "group", "albums" ],
+                        default = "group")
+
+    parser.add_argument("--cache",
+                        help = "Keep album and photo listings in an SQLite "
+                               "database so they can be reused by later runs",
+                        metavar = "FILENAME")
+
+    parser.add_argument("--cache-ttl",
+                        help = "How many hours cached listings stay valid "
+                               "(default 24)",
+                        type = float,
+                        default = 24,
+                        metavar = "HOURS")
+
+    parser.add_argument("--refresh",
+                        help = "Bring the --cache up to date, only fetching "
+                               "photos from albums that have been modified",
+                        action = "store_true")
+
+    parser.add_argument("--http-cache",
+                        help = "Keep the replies from the API in an SQLite "
+                               "database, and only download pages again if "
+                               "the server says they have changed",
+                        metavar = "FILENAME")
+
+    parser.add_argument("--http-cache-size",
+                        help = "Keep the --http-cache under this size, "
+                               "dropping the replies used longest ago "
+                               "(default 100)",
+                        type = float,
+                        default = 100,
+                        metavar = "MB")
+
+    parser.add_argument("--journal",
+                        help = "Keep track of --download-all in an SQLite "
+                               "database so an interrupted run can skip "
+                               "photos it has already downloaded",
+                        metavar = "FILENAME")
+
+    parser.add_argument("--report-deleted",
+                        help = "With --sync, list the photos that have been "
+                               "downloaded before but are no longer in the "
+                               "group (or album). Nothing is deleted",
+                        action = "store_true")
+
+    parser.add_argument("--dedup",
+                        help = "Keep one copy of each distinct photo from "
+                               "--download-all in a store in DIRECTORY and "
+                               "link the album files to it. Photos with the "
+                               "same size, dimensions and filename as one "
+                               "already stored are linked instead of being "
+                               "downloaded",
+                        metavar = "DIRECTORY")
+
+    parser.add_argument("--engine",
+                        help = "How to run concurrent requests: with "
+                               "\"threads\" (the default) or with \"async\" "
+                               "(asyncio, needs aiohttp) which copes better "
+                               "with very large --jobs",
+                        choices = [ "threads", "async" ],
+                        default = "threads")
+
+    parser.add_argument("--stats",
+                        help = "Print latency, throughput and error "
+                               "statistics for the requests made at the end "
+                               "of the run",
+                        action = "store_true")
+
+    parser.add_argument("--trace",
+                        help = "Write the timing of every request to FILENAME "
+                               "as JSON lines",
+                        metavar = "FILENAME")
+
+    parser.add_argument("--retries",
+                        help = "How many times to retry a request if the "
+                               "server is busy or the connection fails "
+                               "(default 5)",
+                        type = int,
+                        default = 5,
+                        metavar = "N")
+
+    parser.add_argument("--rate",
+                        help = "Start off making at most N requests per "
+                               "second. The rate is adjusted automatically "
+                               "if the server starts throttling us. By "
+                               "default there's no limit until then",
+                        type = float,
+                        metavar = "N")
+
+    parser.add_argument("--order",
+                        help = "The order for --download-all to download "
+                               "photos in: as they are listed (the default, "
+                               "which starts downloading while the group is "
+                               "still being listed), largest first, or "
+                               "smallest first to get through the most "
+                               "photos soonest. Sorting needs the whole "
+                               "listing first",
+                        choices = [ "listing", "largest", "smallest" ],
+                        default = "listing")
+
+    parser.add_argument("--check-space",
+                        help = "Before --download-all starts, add up how "
+                               "much there is to fetch for each album and "
+                               "stop if there isn't room for it. This needs "
+                               "the whole listing first",
+                        action = "store_true")
+
+    parser.add_argument("--variant",
+                        help = "Which version of each photo to download: "
+                               "the largest (the default) or smallest that "
+                               "fits within --max-dimension and "
+                               "--max-bytes, or the closest to them",
+                        choices = [ "largest", "smallest", "closest" ],
+                        default = "largest")
+
+    parser.add_argument("--max-dimension",
+                        help = "Don't download versions of photos that are "
+                               "more than PIXELS along their longest side, "
+                               "unless there's nothing smaller",
+                        type = int,
+                        metavar = "PIXELS")
+
+    parser.add_argument("--max-bytes",
+                        help = "Don't download versions of photos that are "
+                               "bigger than BYTES, unless there's nothing "
+                               "smaller",
+                        type = int,
+                        metavar = "BYTES")
+
+    parser.add_argument("--preview",
+                        help = "Have --download-all fetch the smallest "
+                               "version of every photo first, then go back "
+                               "and replace them with the ones chosen by "
+                               "--variant",
+                        action = "store_true")
+
+    parser.add_argument("--archive",
+                        help = "Have --download-all put the photos into a "
+                               "tar or zip file named after the group, with "
+                               "an index alongside it, instead of separate "
+                               "files",
+                        choices = [ "tar", "zip" ])
+
+    parser.add_argument("--archive-per-album",
+                        help = "Make an --archive for each album instead, "
+                               "named after its directory",
+                        action = "store_true")
+
+    parser.add_argument("--extract-photo-id",
+                        help = "Copy the photo with this ID out of the "
+                               "archives made by --archive in the current "
+                               "directory (as --filename if given)",
+                        type = int,
+                        metavar = "ID")
+
+    parser.add_argument("--verify",
+                        help = "Check that each photo --download-all "
+                               "downloads or finds already there really is "
+                               "an image of the type and size the listing "
+                               "says, while the downloads carry on, and "
+                               "download it again if not",
+                        action = "store_true")
+
+    parser.add_argument("--verify-jobs",
+                        help = "Number of processes checking photos for "
+                               "--verify (default: one for each CPU)",
+                        type = int,
+                        metavar = "N")
+
+    parser.add_argument("--bandwidth",
+                        help = "Download at most MB megabytes a second, "
+                               "all together",
+                        type = float,
+                        metavar = "MB")
+
+    args = parser.parse_args()
+
+    if args.batch:
+        if args.groupname:
+            parser.error("give either a group name or --batch, not both")
+
+        if args.list_albums or args.list_albums_csv or args.list_album_ids or \
+           args.album or args.album_id or args.list_photos or \
+           args.list_photos_csv or args.list_photo_ids or \
+           args.download_photo or args.download_photo_id or \
+           args.retry_failed or args.cache:
+            parser.error("--batch only archives whole groups, so it can't be "
+                         "used with options for listing, choosing albums or "
+                         "photos, --retry-failed or --cache")
+
+        if args.engine == "async":
+            parser.error("--batch needs --engine threads")
+
+        if args.report_deleted:
+            parser.error("--report-deleted can't be used with --batch")
+
+        if args.order != "listing" or args.check_space or args.preview:
+            parser.error("--batch can't be used with --order, --check-space "
+                         "or --preview")
+
+        if args.batch_groups < 1:
+            parser.error("--batch-groups must be at least 1")
+
+        # Each group writes its own log in its directory at the same time as
+        # the others, so they mustn't all end up in the same file
+        if args.log_csv and (pathlib.Path(args.log_csv).is_absolute() or
+                             ".." in pathlib.Path(args.log_csv).parts):
+            parser.error("with --batch, --log-csv is written in each group's "
+                         "directory, so it must be a filename there rather "
+                         "than a path outside it")
+    elif not args.groupname:
+        parser.error("the group name is required (or use --batch)")
+
+    if args.retry_failed and not args.journal:
+        parser.error("--retry-failed needs --journal")
+
+    if args.sync and not args.journal:
+        parser.error("--sync needs --journal, which is where it keeps track "
+                     "of what it has downloaded")
+
+    if args.report_deleted and not args.sync:
+        parser.error("--report-deleted needs --sync")
+
+    if args.engine == "async" and aiohttp is None:
+        parser.error("--engine async needs the aiohttp module")
+
+    if args.refresh and not args.cache:
+        parser.error("--refresh needs --cache")
+
+    if args.jobs < 1 or args.list_jobs < 1:
+        parser.error("--jobs and --list-jobs must be at least 1")
+
+    if args.page_size < 1:
+        parser.error("--page-size must be at least 1")
+
+    if args.variant == "closest" and args.max_dimension is None and \
+       args.max_bytes is None:
+        parser.error("--variant closest needs --max-dimension or --max-bytes")
+
+    if args.archive:
+        if args.dedup or args.preview:
+            parser.error("--archive can't be used with --dedup or --preview")
+
+        if args.engine == "async":
+            parser.error("--archive needs --engine threads")
+    elif args.archive_per_album:
+        parser.error("--archive-per-album needs --archive")
+
+    if args.verify and (args.archive or args.dedup):
+        parser.error("--verify can't be used with --archive or --dedup")
+
+    if args.verify_jobs is not None and args.verify_jobs < 1:
+        parser.error("--verify-jobs must be at least 1")
+
+    if args.bandwidth is not None and args.bandwidth <= 0:
+        parser.error("--bandwidth must be more than 0")
+
+    global api_base, page_size, list_jobs, retries, limiter, engine, stats, \
+           pool_size, user_agent, http_cache, bandwidth, variant_policy, \
+           max_dimension, max_bytes, verifier
+
+    if args.api_base:
+        api_base = args.api_base
+
+    page_size = args.page_size
+    list_jobs = args.list_jobs
+    retries = args.retries
+
+    if args.rate:
+        limiter = RateLimiter(args.rate)
+
+    if args.bandwidth:
+        bandwidth = BandwidthCap(args.bandwidth * 1e6)
+
+    variant_policy = args.variant
+    max_dimension = args.max_dimension
+    max_bytes = args.max_bytes
+
+    if args.stats or args.trace:
+        stats = Stats(args.trace)
+        atexit.register(stats.close)
+
+    if args.http_cache:
+        http_cache = HttpCache(args.http_cache, args.http_cache_size * 1e6)
+
+    if args.verify:
+        # The processes are started afresh rather than forked, as there will
+        # be threads running by the time they're wanted
+        import concurrent.futures
+
+        verifier = concurrent.futures.ProcessPoolExecutor(
+                       max_workers = args.verify_jobs,
+                       mp_context = multiprocessing.get_context("spawn"))
+        atexit.register(verifier.shutdown)
+
+    pool_size = max(args.jobs, args.list_jobs)
+
+    if args.no_cookies:
+        cookiejar = None
+
+    if args.chrome:
+        cookiejar = browser_cookies("chrome", args.cookie_cache)
+        # Pretend to be Chrome 58 on Win10 x64
+        # This doesn't seem to be necessary but we might as well as it's easy
+        user_agent = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) " \
+                     "AppleWebKit/537.36 (KHTML, like Gecko) " \
+                     "Chrome/58.0.3029.110 Safari/537.36"
+
+    if args.firefox:
+        cookiejar = browser_cookies("firefox", args.cookie_cache)
+        # Pretend to be Firefox 53 on Win10 x64
+        user_agent = "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:53.0) " \
+                     "Gecko/20100101 Firefox/53.0"
+
+    # The cookies and User-Agent need to be settled before this as the
+    # engine picks them up when it starts
+    if args.engine == "async":
+        engine = AsyncEngine(max(args.jobs, args.list_jobs))
+        atexit.register(engine.close)
+
+    if args.batch:
+        exit(0 if run_batch(args, cookiejar) else 8)
+
+    # This only needs the archives, not the group
+    if args.extract_photo_id is not None:
+        if not extract_photo(pathlib.Path.cwd(), args.extract_photo_id,
+                             args.filename):
+            print("\nThe photo with ID number " +
+                  str(args.extract_photo_id) + " isn't in any of the "
+                  "archives here.")
+            exit(5)
+
+        exit(0)
+
+    journal = None
+    if args.journal:
+        journal = DownloadJournal(args.journal, args.groupname)
+
+    store = None
+    if args.dedup:
+        store = DedupStore(args.dedup)
+
+    cache = None
+    if args.cache:
+        cache = ListingCache(args.cache, args.groupname, args.cache_ttl * 3600)
+
+    # We only need to check that we can get into the group if we're going to
+    # be talking to the server, which we might not be if the cache has
+    # everything we need
+    groupStats = None
+
+    def group_stats():
+        nonlocal groupStats
+        if groupStats is None:
+            groupStats = connect_to_group(args.groupname, cookiejar)
+        return groupStats
+
+    if not cache:
+        group_stats()
+
+    album = None
+    catalog = Catalog()
+    stream = False
+    photoCount = 0
+
+    if args.list_albums or \
+       args.list_albums_csv or \
+       args.list_album_ids or \
+       args.album or \
+       args.album_id or \
+       args.download_all or \
+       args.sync or \
+       args.listing == "albums" or \
+       (cache and args.refresh):
+        # Albums that have changed since they were cached
+        changed = set()
+
+        if cache and not args.refresh and cache.fresh("albums"):
+            print("\nUsing cached album list...")
+            albums = cache.get_albums()
+        else:
+            total = group_stats()["albums"]
+
+            print("\nFetching album list...")
+            albums = get_album_list(args.groupname, cookiejar, total)
+
+            if cache and albums:
+                changed = cache.put_albums(albums)
+
+        # Did we get any albums back?
+        if not albums:
+            # No. Empty list.
+            print("\nFetching the album list failed.")
+            exit(4)
+
+        print("\nRetrieved details of " + str(len(albums)) + " albums.")
+        catalog.add_albums(albums)
+
+        if args.list_albums:
+            list_albums_long(albums)
+
+        if args.list_albums_csv:
+            print("\nSaved file " +
+                  list_albums_csv(albums, args.list_albums_csv))
+
+        if args.list_album_ids:
+            list_album_ids(albums)
+
+        if args.album:
+            a = catalog.albums_named(args.album)
+
+            if not a:
+                print("\nUnable to find the album called '" + args.album + "'.")
+                print("Please double-check the name.")
+                exit(5)
+
+            if len(a) == 1:
+                # Just one hit - good
+                #albumid = a[0].ID
+                album = a[0]
+                print("\nSelected the following album:")
+                list_albums_long(a)
+            else:
+                # Is this possible?
+                print("\nSearch returned " + str(len(a)) +
+                      " albums with that name!")
+                print("Please use --album-id with the ID number from the "
+                      "following list:")
+                list_albums_long(a)
+                exit(6)
+
+        if args.album_id:
+            a = catalog.album_with_id(args.album_id)
+
+            if not a:
+                print("\nUnable to find the album with ID number " +
+                    str(args.album_id) + ".")
+                print("Please double-check the number.")
+                exit(5)
+
+            if len(a) == 1:
+                # Just one hit - good
+                #albumid = args.album_id
+                album = a[0]
+                print("\nSelected the following album:")
+                list_albums_long(a)
+            else:
+                # This is probably impossible
+                print("\nSearch returned " + str(len(a)) +
+                      " albums with that ID!")
+                print("Maybe try using --album with the album name from the "
+                      "following table?")
+                list_album_ids(a)
+                exit(6)
+
+    if args.list_photos or \
+       args.list_photos_csv or \
+       args.list_photo_ids or \
+       args.download_photo or \
+       args.download_photo_id or \
+       args.download_all or \
+       args.sync:
+
+        albumid = album.ID if album else None
+
+        # Unless we need the whole list up front, to search it, to save it
+        # in the cache or to plan the downloads, the photos are dealt with as
+        # they arrive rather than waiting for the complete listing
+        stream = not cache and not args.download_photo and \
+                 not args.download_photo_id and args.order == "listing" and \
+                 not args.check_space
+
+        if cache and not args.refresh and cache.fresh_photos(albumid):
+            print("\nUsing cached photo list...")
+            photos = cache.get_photos(albumid)
+        elif cache and args.refresh and cache.has_photos(albumid):
+            # Only fetch the albums that have changed
+            print("\nRefreshing cached photo list...")
+            photos = cache.refresh_photos(cookiejar,
+                                          [ album ] if album else albums,
+                                          changed, albumid)
+        elif not album and args.listing == "albums":
+            # Get them all, an album at a time
+            print("\nFetching list of all photos in the group, album by "
+                  "album...")
+            if stream:
+                photos = iter_photo_list_sharded(args.groupname, cookiejar,
+                                                 albums)
+            else:
+                photos = get_photo_list_sharded(args.groupname, cookiejar,
+                                                albums)
+
+            if cache and photos:
+                cache.put_photos(photos)
+        elif not album:
+            # Get them all
+            print("\nFetching list of all photos in the group...")
+            print("(This could take a while.)")
+            if stream:
+                photos = iter_photo_list_group(args.groupname, cookiejar,
+                                               group_stats()["photos"])
+            else:
+                photos = get_photo_list_group(args.groupname, cookiejar,
+                                              group_stats()["photos"])
+
+            if cache and photos:
+                cache.put_photos(photos)
+        else:
+            # Just get one album
+            print("\nFetching list of photos in the album...")
+            if stream:
+                photos = iter_photo_list_album(args.groupname, cookiejar,
+                                               album.ID, album.photos)
+            else:
+                photos = get_photo_list_album(args.groupname, cookiejar,
+                                              album.ID, album.photos)
+
+            if cache and photos:
+                cache.put_photos(photos, albumid)
+
+        if stream:
+            # Everything that wants to see the photos gets hooked in to the
+            # stream, and they all get their turn as each photo goes past
+            photos = checked_listing(photos)
+
+            def count_photo(photo):
+                nonlocal photoCount
+                photoCount += 1
+
+            photos = tap(photos, count_photo)
+
+            if args.list_photos:
+                photos = tap(photos, lambda p: list_photos_long([ p ]))
+
+            if args.list_photos_csv:
+                photocsv = TableWriter(args.list_photos_csv, Photo.fields)
+                atexit.register(photocsv.close)
+                photos = tap(photos, lambda p: photocsv.writerow(p.row()))
+
+            if args.list_photo_ids:
+                print("\nID          Name")
+                print(  "==          ====")
+                photos = tap(photos, list_photo_id)
+        else:
+            # Did we get any photos back?
+            if not photos:
+                # No. Empty list.
+                print("Fetching the photo list failed.")
+                exit(7)
+
+            print("\nRetrieved details of " + str(len(photos)) + " photos.")
+            catalog.add_photos(photos)
+
+            if args.list_photos:
+                list_photos_long(photos)
+
+            if args.list_photos_csv:
+                print("\nSaved file " +
+                      list_photos_csv(photos, args.list_photos_csv))
+
+            if args.list_photo_ids:
+                list_photo_ids(photos)
+
+        if args.download_photo:
+            p = catalog.photos_named(args.download_photo)
+
+            if not p:
+                print("\nUnable to find the photo called '" +
+                      args.download_photo + "'.")
+                print("Please double-check the name.")
+                exit(5)
+
+            if len(p) == 1:
+                # Just one hit - good
+                print("\nSelected the following photo:")
+                list_photos_long(p)
+
+                # Pretend to have clicked through from the album page
+                referer = "https://groups.yahoo.com/neo/groups/" + \
+                          args.groupname + "/photos/albums/" + str(p[0].albumID)
+
+                result = download_photo(p[0], cookiejar, args.filename,
+                                        { "Referer": referer }, args.resume)
+                if result == 200:
+                    print("Downloaded successfully.")
+                else:
+                    print("Server returned error " + str(result))
+            else:
+                # More than one hit. This can happen.
+                print("\nSearch returned " + str(len(p)) +
+                      " photos with that name!")
+                print("Please use --download-photo-id with the ID number from "
+                      "the following list:")
+                list_photos_long(p, True)
+                exit(6)
+
+        if args.download_photo_id:
+            p = catalog.photo_with_id(args.download_photo_id)
+
+            if not p:
+                print("\nUnable to find the photo with ID number " +
+                    str(args.download_photo_id) + ".")
+                print("Please double-check the number.")
+                exit(5)
+
+            if len(p) == 1:
+                # Just one hit - good
+                print("\nSelected the following photo:")
+                list_photos_long(p, True)
+
+                # Pretend to have clicked through from the album page
+                referer = "https://groups.yahoo.com/neo/groups/" + \
+                          args.groupname + "/photos/albums/" + str(p[0].albumID)
+
+                result = download_photo(p[0], cookiejar, args.filename,
+                                        { "Referer": referer }, args.resume)
+                if result == 200:
+                    print("Downloaded successfully.")
+                else:
+                    print("Server returned error " + str(result))
+            else:
+                # This is probably impossible
+                print("\nSearch returned " + str(len(p)) +
+                      " photos with that ID!")
+                print("Maybe try using --download-photo with the photo name "
+                      "from the following table?")
+                list_photo_ids(p)
+                exit(6)
+
+    if args.download_all or args.sync or args.retry_failed:
+        logger = None
+        if args.log_csv:
+            logger = TableWriter(args.log_csv, log_fields, log_flush_interval)
+            atexit.register(logger.close)
+
+        # Get the current working directory
+        cwd = pathlib.Path.cwd()
+
+        # Photos the journal says we've already got, or with --sync, what it
+        # says they were like when we got them
+        done = journal.done_photos() if journal and not args.sync else set()
+        manifest = journal.manifest() if args.sync else {}
+        changed = set()
+        skipped = 0
+
+        # Has the user selected an album?
+        if album:
+            print("\nDownloading into directory " +
+                  catalog.album_dirname(album.ID))
+
+        plan = DownloadPlan(cwd, catalog, album, make_dirs = not args.archive)
+        sink = ArchiveSink(cwd, args.groupname, args.archive,
+                           args.archive_per_album) if args.archive else None
+
+#        if not albumid:
+#            # No - use all of them
+#            albumlist = albums
+#        else:
+#            # Yes - just use the selected one
+#            albumlist = [ i for i in albums if i["ID"] == albumid ]
+
+        # Work out where each photo is going
+        def destinations():
+            nonlocal skipped
+
+            if args.retry_failed:
+                for photo, destfile, state in journal.unfinished():
+                    if not args.archive:
+                        destfile.parent.mkdir(parents = True, exist_ok = True)
+
+                    # What's there is a preview, which would pass for the
+                    # full version if its size isn't listed
+                    if state == "preview":
+                        changed.add(photo.ID)
+
+                    yield wanted_variant(photo), destfile, \
+                          destfile.parent.name
+
+                return
+
+            for photo in photos:
+                photo = wanted_variant(photo)
+                state = sync_state(photo, manifest) if args.sync else None
+                destfile, dirname = plan.place(photo)
+
+                if photo.ID in done or state == "same":
+                    skipped += 1
+                    continue
+                elif state == "changed":
+                    changed.add(photo.ID)
+
+                yield photo, destfile, dirname
+
+        places = destinations()
+        expected = None
+
+        # Sorting the downloads or checking there's room for them means
+        # working out where everything is going before starting
+        if args.order != "listing" or args.check_space:
+            places = list(places)
+            expected = estimate_download(places, changed)
+
+        if args.check_space:
+            free = shutil.disk_usage(cwd).free
+
+            if expected > free:
+                print("\nThere isn't enough space: " +
+                      "{:.1f} MB to fetch but only {:.1f} MB free.".format(
+                          expected / 1e6, free / 1e6))
+                exit(9)
+
+            print("\nThere's enough space ({:.1f} MB free).".format(
+                      free / 1e6))
+
+        if args.order != "listing":
+            places.sort(key = lambda p: p[0].filesize or 0,
+                        reverse = args.order == "largest")
+
+        # Downloads are farmed out to a pool of threads
+        import concurrent.futures
+
+        pool = concurrent.futures.ThreadPoolExecutor(max_workers = args.jobs)
+        tally = collections.Counter()
+
+        if args.preview:
+            # Go through everything with the smallest versions first, noting
+            # the photos that need to be gone back for. Photos we've already
+            # got properly are left alone
+            upgrades = []
+            previews = {}
+
+            def smallest_first(places):
+                for photo, destfile, dirname in places:
+                    small = choose_variant(photo, "smallest")
+
+                    try:
+                        got = photo.ID not in changed and \
+                              size_ok(photo, destfile.stat().st_size)
+                    except FileNotFoundError:
+                        got = False
+
+                    if got:
+                        small = photo
+                    elif small is not photo:
+                        upgrades.append((photo, destfile, dirname))
+                        previews[photo.ID] = photo
+
+                    yield small, destfile, dirname
+
+            print("\nFetching previews first...")
+            tally += download_all(smallest_first(places), args.groupname,
+                                  cookiejar, args.jobs, pool.submit,
+                                  args.resume, journal, store, logger,
+                                  changed = changed, previews = previews)
+
+            print("\nReplacing " + str(len(upgrades)) + " previews with the "
+                  "full versions...")
+            places = upgrades
+
+            # The previews are where the full versions go, and one of a photo
+            # whose size isn't listed would pass for the full version
+            changed = changed.union(previews)
+
+            if expected is not None:
+                expected = sum(p[0].filesize or 0 for p in upgrades)
+
+        try:
+            tally += download_all(places, args.groupname, cookiejar,
+                                  args.jobs, pool.submit, args.resume, journal,
+                                  store, logger, changed = changed,
+                                  expected = expected, sink = sink)
+        except ArchiveError as e:
+            print("\n" + str(e))
+            exit(10)
+        finally:
+            if sink:
+                sink.close()
+
+        pool.shutdown()
+
+        if logger:
+            logger.close()
+
+        if skipped and args.sync:
+            print("\nSkipped " + str(skipped) + " photos which haven't "
+                  "changed since they were downloaded.")
+        elif skipped:
+            print("\nSkipped " + str(skipped) + " photos which the journal "
+                  "says have already been downloaded.")
+
+        if changed:
+            print("\nDownloaded " + str(len(changed)) + " photos again "
+                  "because they had changed.")
+
+        if verifier:
+            print("\nVerified " + str(tally["verified"]) + " photos." +
+                  (" " + str(tally["redone"]) + " didn't look right and were "
+                   "downloaded again, and " + str(tally["corrupt"]) +
+                   " still didn't look right after that."
+                   if tally["redone"] else ""))
+
+        if args.report_deleted:
+            # Only the selected album was listed, so only its photos count
+            deleted = [ (ID, known[3]) for ID, known in manifest.items()
+                        if not album or known[2] == album.ID ]
+
+            print("\n" + str(len(deleted)) + " photos we downloaded are no "
+                  "longer in the " + ("album" if album else "group") +
+                  (":" if deleted else "."))
+            for ID, destfile in deleted:
+                print(str(ID).ljust(11) + " " + destfile)
+
+        if store:
+            print("\nLinked " + str(tally["linked"]) + " photos from the store "
+                  "instead of downloading them, and " +
+                  str(tally["duplicates"]) + " downloaded photos turned out "
+                  "to be copies of ones already stored.")
+
+    if stream:
+        if not args.download_all and not args.sync:
+            # Nothing has read through the photos yet
+            for photo in photos:
+                pass
+
+        if args.list_photos_csv:
+            photocsv.close()
+            print("\nSaved file " + photocsv.filename)
+
+        # Did we get any photos?
+        if not photoCount:
+            print("Fetching the photo list failed.")
+            exit(7)
+
+        print("\nRetrieved details of " + str(photoCount) + " photos.")